@@ -1,42 +1,307 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g
+from flask import (Flask, Blueprint, current_app, render_template, request, redirect, url_for, flash, session, g,
+                   Response, stream_with_context, send_from_directory)
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from flask_migrate import Migrate
-from flask_babel import Babel, gettext as _, lazy_gettext as _l
-from flask_restx import Api, Resource, fields
+from flask_babel import Babel, force_locale, get_translations, gettext as _, lazy_gettext as _l
+from flask_restx import Api, Resource, fields, inputs, reqparse
+from flask_restx.utils import unpack
+from flask_sqlalchemy.pagination import Pagination
 from flask_login import LoginManager, UserMixin, login_user, login_required, logout_user, current_user
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
+import base64
+import bisect
+import csv
+import hashlib
+import heapq
+from collections import Counter, OrderedDict
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+import io
+import itertools
+import json
+import mimetypes
 import os
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
 from flask_cors import CORS
+import click
 from dotenv import load_dotenv
-from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.security import generate_password_hash, check_password_hash, safe_join
+from werkzeug.http import http_date
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+from jinja2 import FileSystemBytecodeCache, TemplateError
+from sqlalchemy import event, exc as sa_exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+from sqlalchemy.orm import Session as SASession, configure_mappers, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from flask import has_request_context
+from werkzeug.local import LocalProxy
+import atexit
 import logging
+import logging.handlers
+import queue
+import zlib
+import numpy as np
+
+from compile_translations import compile_catalogs
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key')
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///todo.db')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
+class RoutingSession(FlaskSession):
+    """Сессия с маршрутизацией чтений: в запросах, отправленных на реплику (g.db_route), чтения идут
+    на bind 'replica', а flush и INSERT/UPDATE/DELETE всегда выполняются на основной базе"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_request_context() and g.get('db_route') == 'replica'):
+            return db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+migrate = Migrate()
 
 # Flask-Login setup
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'web.login'
 
 # Flask-Babel setup
-babel = Babel(app)
+babel = Babel()
 
-# Настройка логирования
-logging.basicConfig(level=logging.DEBUG)
-logger = logging.getLogger(__name__)
+# Blueprints: веб-интерфейс, REST API и игра GeoGuessr
+web_bp = Blueprint('web', __name__)
+api_bp = Blueprint('api', __name__)
+geoguessr_bp = Blueprint('geoguessr', __name__)
+
+
+def app_extension(name):
+    """Объект app.extensions[name] текущего приложения: кэши и счетчики у каждого create_app() свои"""
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+def database_url(url):
+    """postgres:// (Heroku, docker-compose) -> postgresql://: SQLAlchemy не знает старое имя схемы"""
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def configure_app(app):
+    """Конфигурация приложения из переменных окружения"""
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-key')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url(os.getenv('DATABASE_URL', 'sqlite:///todo.db'))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    # Профиль движка БД: auto (по URL), postgresql, pgbouncer, sqlite или default (настройки SQLAlchemy).
+    # Явные SQLALCHEMY_ENGINE_OPTIONS перекрывают параметры профиля
+    app.config['DB_ENGINE_PROFILE'] = os.getenv('DB_ENGINE_PROFILE', 'auto')
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+    app.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+    app.config['DB_MAX_OVERFLOW'] = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+    app.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '10'))
+    app.config['DB_POOL_RECYCLE'] = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+    app.config['DB_STATEMENT_TIMEOUT'] = int(os.getenv('DB_STATEMENT_TIMEOUT', '30000'))  # мс, PostgreSQL
+    app.config['DB_SQLITE_BUSY_TIMEOUT'] = int(os.getenv('DB_SQLITE_BUSY_TIMEOUT', '5000'))  # мс
+    app.config['DB_SQLITE_MMAP_SIZE'] = int(os.getenv('DB_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+    app.config['DB_SQLITE_CACHE_SIZE'] = int(os.getenv('DB_SQLITE_CACHE_SIZE', '-65536'))  # < 0 — в КиБ
+    # Реплика для чтения: GET-запросы читают с нее, кроме окна read-your-writes (с) после записи
+    app.config['DATABASE_REPLICA_URL'] = os.getenv('DATABASE_REPLICA_URL')
+    app.config['DB_READ_YOUR_WRITES'] = float(os.getenv('DB_READ_YOUR_WRITES', '5'))
+    # Инструментирование SQL: счетчик и время запросов на каждый HTTP-запрос
+    app.config['SQL_STATS_ENABLED'] = os.getenv('SQL_STATS_ENABLED', '1') == '1'
+    app.config['SQL_STATS_HEADERS'] = os.getenv('SQL_STATS_HEADERS', '1') == '1'
+    app.config['SQL_STATS_LOG'] = os.getenv('SQL_STATS_LOG', '0') == '1'
+    app.config['SQL_STATS_SLOWEST'] = int(os.getenv('SQL_STATS_SLOWEST', '3'))
+    # Бюджеты запросов по endpoint, например {'web.index': 5}; при превышении в режиме
+    # SQL_QUERY_BUDGET_STRICT (включен в тестах) запрос завершается ошибкой
+    app.config['SQL_QUERY_BUDGETS'] = {}
+    app.config['SQL_QUERY_BUDGET_STRICT'] = os.getenv('SQL_QUERY_BUDGET_STRICT', '0') == '1'
+    # Кэш пользователя и роли для user_loader (в пределах процесса)
+    app.config['IDENTITY_CACHE_TTL'] = int(os.getenv('IDENTITY_CACHE_TTL', '60'))
+    app.config['IDENTITY_CACHE_SIZE'] = int(os.getenv('IDENTITY_CACHE_SIZE', '1024'))
+    # Кэш ответов API (роли, опции, пользователи): lru — в памяти процесса, sqlite — общий файл, none — выключен
+    app.config['RESPONSE_CACHE_BACKEND'] = os.getenv('RESPONSE_CACHE_BACKEND', 'lru')
+    app.config['RESPONSE_CACHE_TTL'] = int(os.getenv('RESPONSE_CACHE_TTL', '300'))
+    app.config['RESPONSE_CACHE_SIZE'] = int(os.getenv('RESPONSE_CACHE_SIZE', '1024'))
+    app.config['RESPONSE_CACHE_PATH'] = os.getenv('RESPONSE_CACHE_PATH',
+                                                  os.path.join(app.instance_path, 'response_cache.db'))
+    # Срок действия набора раундов GeoGuessr (с), выданного /geoguessr/round_set
+    app.config['GEOGUESSR_ROUND_TTL'] = int(os.getenv('GEOGUESSR_ROUND_TTL', '7200'))
+    # Проверка правдоподобия игры перед записью: раунд длится не меньше GEOGUESSR_MIN_ROUND_SECONDS с показа
+    # локации (0 — без проверки), и не больше GEOGUESSR_MAX_PERFECT_ROUNDS догадок ближе GEOGUESSR_PERFECT_DISTANCE_M
+    app.config['GEOGUESSR_MIN_ROUND_SECONDS'] = float(os.getenv('GEOGUESSR_MIN_ROUND_SECONDS', '3'))
+    app.config['GEOGUESSR_PERFECT_DISTANCE_M'] = float(os.getenv('GEOGUESSR_PERFECT_DISTANCE_M', '25'))
+    app.config['GEOGUESSR_MAX_PERFECT_ROUNDS'] = int(os.getenv('GEOGUESSR_MAX_PERFECT_ROUNDS', '1'))
+    # Каталог локаций GeoGuessr (flask build-location-catalog); без него — встроенные GEOGUESSR_LOCATIONS.
+    # Последние GEOGUESSR_RECENT_LOCATIONS локаций сессии не повторяются, пока есть другие
+    app.config['GEOGUESSR_CATALOG_PATH'] = os.getenv('GEOGUESSR_CATALOG_PATH',
+                                                     os.path.join(app.instance_path, 'locations.geocat'))
+    app.config['GEOGUESSR_RECENT_LOCATIONS'] = int(os.getenv('GEOGUESSR_RECENT_LOCATIONS', '50'))
+    # Результаты GeoGuessr: sync — INSERT + COMMIT на запрос, batch — очередь и запись пачками в фоне.
+    # SCORE_SPOOL: write — копия очереди в файле (переживает падение процесса), fsync — и падение ОС, off — нет
+    app.config['SCORE_INGEST_MODE'] = os.getenv('SCORE_INGEST_MODE', 'sync')
+    app.config['SCORE_BATCH_SIZE'] = int(os.getenv('SCORE_BATCH_SIZE', '500'))
+    app.config['SCORE_BATCH_INTERVAL'] = float(os.getenv('SCORE_BATCH_INTERVAL', '0.5'))
+    app.config['SCORE_QUEUE_SIZE'] = int(os.getenv('SCORE_QUEUE_SIZE', '10000'))
+    app.config['SCORE_SPOOL'] = os.getenv('SCORE_SPOOL', 'write')
+    app.config['SCORE_SPOOL_DIR'] = os.getenv('SCORE_SPOOL_DIR', os.path.join(app.instance_path, 'score_spool'))
+    # Хеширование паролей: алгоритм/стоимость в формате werkzeug и размер пула
+    app.config['PASSWORD_HASH_METHOD'] = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    app.config['PASSWORD_HASH_WORKERS'] = int(os.getenv('PASSWORD_HASH_WORKERS', str(os.cpu_count() or 2)))
+    app.config['PASSWORD_HASH_MAX_PENDING'] = int(os.getenv('PASSWORD_HASH_MAX_PENDING',
+                                                            str(app.config['PASSWORD_HASH_WORKERS'] * 8)))
+    app.config['PASSWORD_HASH_TIMEOUT'] = float(os.getenv('PASSWORD_HASH_TIMEOUT', '5'))
+    # Сжатие динамических ответов (gzip/brotli по Accept-Encoding)
+    app.config['COMPRESS_ENABLED'] = os.getenv('COMPRESS_ENABLED', '1') == '1'
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '500'))
+    app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv('COMPRESS_GZIP_LEVEL', '6'))
+    app.config['COMPRESS_BROTLI_LEVEL'] = int(os.getenv('COMPRESS_BROTLI_LEVEL', '4'))
+    # Шаблоны: в production не перепроверяются на диске, байткод хранится между перезапусками
+    app.config['TEMPLATES_AUTO_RELOAD'] = os.getenv(
+        'TEMPLATES_AUTO_RELOAD', '1' if os.getenv('FLASK_ENV') == 'development' else '0') == '1'
+    app.config['JINJA_CACHE_DIR'] = os.getenv('JINJA_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+    app.config['COMPRESS_MIMETYPES'] = [
+        'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript', 'application/javascript',
+        'application/json', 'application/x-ndjson', 'application/xml', 'image/svg+xml',
+    ]
+    # Настройка логирования: записи кладутся в очередь, в поток вывода их пишет фоновый поток
+    app.config['LOG_LEVEL'] = os.getenv('LOG_LEVEL', 'DEBUG' if os.getenv('FLASK_ENV') == 'development' else 'INFO')
+    app.config['LOG_FORMAT'] = os.getenv('LOG_FORMAT', 'text' if os.getenv('FLASK_ENV') == 'development' else 'json')
+    app.config['LOG_QUEUE_SIZE'] = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    # Доля DEBUG-записей, которые пишутся для шумных категорий (логгеров), например "locale=0.01,sql=0.1"
+    app.config['LOG_SAMPLING'] = {
+        category.strip(): float(rate)
+        for category, rate in (item.split('=') for item in os.getenv('LOG_SAMPLING', '').split(',') if item.strip())
+    }
+
+    # Настройки Babel
+    app.config['BABEL_DEFAULT_LOCALE'] = 'ru'  # Русский по умолчанию
+    app.config['BABEL_SUPPORTED_LOCALES'] = ['ru', 'en']  # Поддерживаемые языки
+    # Прогрев процесса перед приемом запросов: сколько соединений открыть в пуле заранее
+    app.config['WARMUP_DB_CONNECTIONS'] = int(os.getenv('WARMUP_DB_CONNECTIONS', '2'))
+    # ASGI-режим (asgi.py): URL для асинхронного драйвера; по умолчанию выводится из DATABASE_URL
+    app.config['ASYNC_DATABASE_URL'] = os.getenv('ASYNC_DATABASE_URL')
+    app.config['ASYNC_REPLICA_DATABASE_URL'] = os.getenv('ASYNC_REPLICA_DATABASE_URL')
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+            'thread': record.threadName,
+        }
+        http = getattr(record, 'http', None)
+        if http:
+            entry.update(http)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class AsyncLogHandler(logging.handlers.QueueHandler):
+    """QueueHandler без форматирования в потоке запроса.
+
+    Сообщение собирается из msg % args уже в фоновом потоке (форматтером обработчика вывода).
+    Запись никогда не блокирует поток: при переполненной очереди она отбрасывается,
+    а число отброшенных записей сообщается, как только в очереди появится место.
+    """
+
+    def __init__(self, log_queue, sampling=None):
+        super().__init__(log_queue)
+        self.sampling = sampling or {}
+        self.dropped = 0
+
+    def _sample_rate(self, record):
+        for category, rate in self.sampling.items():
+            if record.name == category or record.name.endswith('.' + category):
+                return rate
+        return 1.0
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and self.sampling and random.random() >= self._sample_rate(record):
+            return False
+        return super().filter(record)
+
+    def prepare(self, record):
+        # Traceback держит ссылки на кадры стека, поэтому превращается в текст сразу
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        if has_request_context():
+            record.http = {'method': request.method, 'path': request.path}
+        return record
+
+    def enqueue(self, record):
+        try:
+            if self.dropped:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                    'msg': 'Log queue overflow: %d records dropped', 'args': (self.dropped,)}))
+                self.dropped = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(config):
+    """Ставит AsyncLogHandler на корневой логгер и запускает поток вывода.
+
+    Возвращает QueueListener. Поток не переживает fork, поэтому в дочернем процессе
+    функцию нужно вызвать заново (см. create_app).
+    """
+    global log_listener
+    if log_listener is not None:
+        log_listener.stop()
+    output = logging.StreamHandler()
+    if config['LOG_FORMAT'] == 'json':
+        output.setFormatter(JsonLogFormatter())
+    else:
+        output.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    log_queue = queue.Queue(maxsize=config['LOG_QUEUE_SIZE'])
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(AsyncLogHandler(log_queue, config['LOG_SAMPLING']))
+    root.setLevel(config['LOG_LEVEL'])
+    log_listener = logging.handlers.QueueListener(log_queue, output)
+    log_listener.start()
+    return log_listener
+
+
+def _stop_logging():
+    # Остаток очереди дописывается при завершении процесса
+    if log_listener is not None:
+        log_listener.stop()
 
-# Настройки Babel
-app.config['BABEL_DEFAULT_LOCALE'] = 'ru'  # Русский по умолчанию
-app.config['BABEL_SUPPORTED_LOCALES'] = ['ru', 'en']  # Поддерживаемые языки
+
+log_listener = None
+atexit.register(_stop_logging)
+logger = logging.getLogger(__name__)
+locale_logger = logger.getChild('locale')
 
 # Инициализация Babel с динамическим выбором локали
 def get_locale():
@@ -45,31 +310,29 @@ def get_locale():
         from flask import g
         # Сначала проверяем объект g, установленный в load_user_settings
         if hasattr(g, 'babel_locale') and g.babel_locale:
-            logger.debug(f"get_locale from g: {g.babel_locale}")
+            locale_logger.debug("get_locale from g: %s", g.babel_locale)
             return g.babel_locale
         # Затем проверяем сессию
         lang = session.get('language')
-        logger.debug(f"get_locale from session: {lang}")
+        locale_logger.debug("get_locale from session: %s", lang)
         if not lang:
             # Если в сессии нет, используем принятые языки браузера
-            lang = request.accept_languages.best_match(app.config['BABEL_SUPPORTED_LOCALES'])
-            logger.debug(f"get_locale from browser: {lang}")
+            lang = request.accept_languages.best_match(current_app.config['BABEL_SUPPORTED_LOCALES'])
+            locale_logger.debug("get_locale from browser: %s", lang)
         if not lang:
-            lang = app.config['BABEL_DEFAULT_LOCALE']
-        logger.debug(f"get_locale returning: {lang}")
+            lang = current_app.config['BABEL_DEFAULT_LOCALE']
+        locale_logger.debug("get_locale returning: %s", lang)
         return lang
     except Exception as e:
-        logger.error(f"Error in get_locale: {e}")
-        return app.config['BABEL_DEFAULT_LOCALE']
+        locale_logger.exception("Error in get_locale: %s", e)
+        return current_app.config['BABEL_DEFAULT_LOCALE']
 
-babel.init_app(app, locale_selector=get_locale)
 
-@app.before_request
 def load_user_settings():
     """Загружаем пользовательские настройки перед каждым запросом"""
     # Устанавливаем значения по умолчанию, если они не установлены
     if 'language' not in session:
-        session['language'] = app.config['BABEL_DEFAULT_LOCALE']
+        session['language'] = current_app.config['BABEL_DEFAULT_LOCALE']
     if 'theme' not in session:
         session['theme'] = 'dark'
     if 'per_page' not in session:
@@ -77,14 +340,685 @@ def load_user_settings():
     
     # Обновляем локаль для Babel, если язык в сессии изменился
     from flask import g
-    g.babel_locale = session.get('language', app.config['BABEL_DEFAULT_LOCALE'])
+    g.babel_locale = session.get('language', current_app.config['BABEL_DEFAULT_LOCALE'])
+
+class ResponseCompressor:
+    """Компрессор тела ответа (gzip или brotli) с учетом затраченного времени CPU"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        self.cpu_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+            self._process, self._flush, self._finish = (
+                self._compressor.process, self._compressor.flush, self._compressor.finish)
+        else:
+            # wbits=31: формат gzip (заголовок и CRC), а не "голый" deflate
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._process = self._compressor.compress
+            self._flush = lambda: self._compressor.flush(zlib.Z_SYNC_FLUSH)
+            self._finish = self._compressor.flush
+
+    def _timed(self, data, *steps):
+        started = time.thread_time()
+        result = b''.join(step(*args) for step, args in steps)
+        self.cpu_time += time.thread_time() - started
+        self.bytes_in += len(data)
+        self.bytes_out += len(result)
+        return result
+
+    def compress(self, data):
+        """Сжимает тело ответа целиком"""
+        return self._timed(data, (self._process, (data,)), (self._finish, ()))
+
+    def chunk(self, data):
+        """Сжимает очередной фрагмент потока и сразу отдает его клиенту"""
+        return self._timed(data, (self._process, (data,)), (self._flush, ()))
+
+    def finish(self):
+        return self._timed(b'', (self._finish, ()))
+
+
+def negotiate_encoding():
+    """Кодировка с наибольшим q из Accept-Encoding; при равенстве brotli предпочтительнее"""
+    best, best_quality = None, 0
+    for encoding in (('br',) if brotli is not None else ()) + ('gzip',):
+        quality = request.accept_encodings[encoding]
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def _compressed_stream(chunks, original, compressor):
+    try:
+        for chunk in chunks:
+            if chunk:
+                yield compressor.chunk(chunk)
+        yield compressor.finish()
+    finally:
+        if hasattr(original, 'close'):
+            original.close()
+        logger.debug('Streamed %s: %d -> %d bytes, %.2f ms CPU', compressor.encoding,
+                     compressor.bytes_in, compressor.bytes_out, compressor.cpu_time * 1000)
+
+
+def compress_response(response):
+    """Сжимает HTML/JSON-ответы gzip или brotli в зависимости от Accept-Encoding.
+
+    Хук зарегистрирован раньше остальных after_request и поэтому выполняется последним.
+    Время CPU на сжатие попадает в Server-Timing (compress) для обычных ответов;
+    потоковые ответы сжимаются по мере отдачи фрагментов.
+    """
+    if (not current_app.config['COMPRESS_ENABLED'] or response.direct_passthrough
+            or response.mimetype not in current_app.config['COMPRESS_MIMETYPES']):
+        return response
+    response.vary.add('Accept-Encoding')
+    if (request.method == 'HEAD' or response.status_code < 200 or response.status_code in (204, 206, 304)
+            or 'Content-Encoding' in response.headers
+            or 'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    encoding = negotiate_encoding()
+    if encoding is None:
+        return response
+    if not response.is_streamed and (response.content_length or 0) < current_app.config['COMPRESS_MIN_SIZE']:
+        return response
+    level = current_app.config['COMPRESS_BROTLI_LEVEL' if encoding == 'br' else 'COMPRESS_GZIP_LEVEL']
+    compressor = ResponseCompressor(encoding, level)
+
+    response.headers['Content-Encoding'] = encoding
+    # Сжатое представление побайтно отличается от исходного
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    if response.is_streamed:
+        response.headers.pop('Content-Length', None)
+        response.response = _compressed_stream(response.iter_encoded(), response.response, compressor)
+        return response
+    response.set_data(compressor.compress(response.get_data()))
+    response.headers.add('Server-Timing', f'compress;dur={compressor.cpu_time * 1000:.2f};'
+                                          f'desc="{encoding} {compressor.bytes_in}->{compressor.bytes_out}"')
+    return response
+
+class QueryBudgetExceeded(Exception):
+    """Endpoint выполнил больше SQL-запросов, чем разрешено в SQL_QUERY_BUDGETS"""
+
+
+class SQLStats:
+    """Статистика SQL-запросов в рамках одного HTTP-запроса"""
+
+    def __init__(self, keep_slowest):
+        self.count = 0
+        self.total = 0.0
+        self.keep_slowest = keep_slowest
+        self.slowest = []
+        self.checkouts = 0
+        self.pool_wait = 0.0
+
+    def add(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        if self.keep_slowest:
+            item = (duration, self.count, ' '.join(statement.split())[:200])
+            if len(self.slowest) < self.keep_slowest:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+
+    def slowest_statements(self):
+        return [(duration, statement) for duration, _, statement in sorted(self.slowest, reverse=True)]
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _sql_stats_before(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('sql_stats_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _sql_stats_after(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['sql_stats_start'].pop()
+    if has_request_context():
+        stats = g.get('sql_stats')
+        if stats is not None:
+            stats.add(statement, time.perf_counter() - started)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _sql_stats_error(context):
+    # after_cursor_execute не вызывается для упавшего выражения: иначе время старта останется
+    # в conn.info соединения пула и следующие замеры получат чужое начало
+    starts = context.connection.info.get('sql_stats_start') if context.connection is not None else None
+    if context.execution_context is not None and starts:
+        starts.pop()
+
+
+def start_sql_stats():
+    if current_app.config['SQL_STATS_ENABLED']:
+        g.sql_stats = SQLStats(current_app.config['SQL_STATS_SLOWEST'])
+
+
+def report_sql_stats(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+    total_ms = stats.total * 1000
+    if current_app.config['SQL_STATS_HEADERS']:
+        response.headers.add('Server-Timing', f'db;dur={total_ms:.2f};desc="{stats.count} queries"')
+        if stats.checkouts:
+            response.headers.add('Server-Timing',
+                                 f'db-pool;dur={stats.pool_wait * 1000:.2f};desc="{stats.checkouts} checkouts"')
+        response.headers['X-DB-Query-Count'] = str(stats.count)
+    if current_app.config['SQL_STATS_LOG']:
+        logger.info('SQL %s %s: %d queries, %.2f ms, slowest: %s',
+                    request.method, request.endpoint, stats.count, total_ms,
+                    ['%.2f ms %s' % (duration * 1000, statement)
+                     for duration, statement in stats.slowest_statements()])
+    budget = current_app.config['SQL_QUERY_BUDGETS'].get(request.endpoint)
+    if budget is not None and stats.count > budget:
+        message = f'{request.endpoint} ran {stats.count} SQL queries, budget is {budget}'
+        if current_app.config['SQL_QUERY_BUDGET_STRICT']:
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
+    return response
+
+# Профили движка БД: параметры пула и настройки соединений под конкретную СУБД
+class PoolMetrics:
+    """Счетчики пула соединений одного движка в пределах процесса"""
+
+    def __init__(self, profile):
+        self.profile = profile
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.timeouts = 0
+            self.connects = 0
+            self.invalidations = 0
+            self.wait_total = 0.0
+            self.wait_max = 0.0
+
+    def record_checkout(self, waited):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connects += 1
+
+    def record_invalidation(self):
+        with self._lock:
+            self.invalidations += 1
+
+    def snapshot(self, pool):
+        with self._lock:
+            data = {
+                'profile': self.profile,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'wait_ms_total': round(self.wait_total * 1000, 3),
+                'wait_ms_avg': round(self.wait_total * 1000 / self.checkouts, 3) if self.checkouts else 0.0,
+                'wait_ms_max': round(self.wait_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            data.update(size=pool.size(), checked_in=pool.checkedin(),
+                        checked_out=pool.checkedout(), overflow=pool.overflow())
+        return data
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool, который замеряет ожидание свободного соединения (в том числе открытие нового)"""
+
+    metrics = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa_exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_timeout()
+            raise
+        waited = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.record_checkout(waited)
+        if has_request_context():
+            stats = g.get('sql_stats')
+            if stats is not None:
+                stats.checkouts += 1
+                stats.pool_wait += waited
+        return connection
+
+    def recreate(self):
+        # dispose() заменяет пул новым экземпляром: счетчики переходят к нему
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def _is_memory_sqlite(config):
+    return make_url(config['SQLALCHEMY_DATABASE_URI']).database in (None, '', ':memory:')
+
+
+def _queue_pool_options(config):
+    return {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+
+
+def postgresql_engine_options(config):
+    return {
+        **_queue_pool_options(config),
+        # Соединение, закрытое сервером или балансировщиком, обнаруживается до выдачи из пула
+        'pool_pre_ping': True,
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_use_lifo': True,
+        'connect_args': {'options': f"-c statement_timeout={config['DB_STATEMENT_TIMEOUT']}"},
+    }
+
+
+def pgbouncer_engine_options(config):
+    # PgBouncer в режиме transaction отклоняет параметр options при подключении, а SET на уровне
+    # сеанса достался бы чужим клиентам: statement_timeout задается через SET LOCAL (_set_local_timeout)
+    options = postgresql_engine_options(config)
+    del options['connect_args']
+    return options
+
+
+def sqlite_engine_options(config):
+    if _is_memory_sqlite(config):
+        # Для :memory: Flask-SQLAlchemy использует StaticPool с единственным соединением
+        return {}
+    # Файловая база: очередь соединений вместо соединения на поток; PRAGMA — в _apply_sqlite_pragmas
+    return {
+        **_queue_pool_options(config),
+        'connect_args': {'timeout': config['DB_SQLITE_BUSY_TIMEOUT'] / 1000, 'check_same_thread': False},
+    }
+
+
+ENGINE_PROFILES = {
+    'postgresql': postgresql_engine_options,
+    'pgbouncer': pgbouncer_engine_options,
+    'sqlite': sqlite_engine_options,
+    'default': lambda config: {},
+}
+
+
+def engine_profile(config):
+    """Имя профиля движка: из DB_ENGINE_PROFILE или, для auto, по схеме DATABASE_URL"""
+    name = config['DB_ENGINE_PROFILE']
+    if name == 'auto':
+        backend = make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name()
+        name = backend if backend in ENGINE_PROFILES else 'default'
+    if name not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown DB_ENGINE_PROFILE {name!r}, expected auto or one of {', '.join(ENGINE_PROFILES)}")
+    return name
+
+
+def _apply_sqlite_pragmas(config):
+    pragmas = [
+        # WAL: читатели не блокируют писателя; NORMAL в режиме WAL не теряет целостность при сбое
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f"PRAGMA busy_timeout={config['DB_SQLITE_BUSY_TIMEOUT']}",
+        f"PRAGMA mmap_size={config['DB_SQLITE_MMAP_SIZE']}",
+        f"PRAGMA cache_size={config['DB_SQLITE_CACHE_SIZE']}",
+    ]
+
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+    return on_connect
+
+
+def _set_local_timeout(config):
+    statement = f"SET LOCAL statement_timeout = {config['DB_STATEMENT_TIMEOUT']}"
+
+    def on_begin(connection):
+        # Напрямую через DBAPI: Connection.execute внутри события begin начал бы новую транзакцию
+        cursor = connection.connection.dbapi_connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+    return on_begin
+
+
+def init_engine(engine, profile, config):
+    """Подключает к движку настройки соединений профиля и счетчики пула"""
+    if profile == 'sqlite' and engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', _apply_sqlite_pragmas(config))
+    elif profile == 'pgbouncer' and engine.dialect.name == 'postgresql':
+        event.listen(engine, 'begin', _set_local_timeout(config))
+    metrics = PoolMetrics(profile)
+    engine.pool.metrics = metrics
+    event.listen(engine, 'connect', lambda dbapi_connection, record: metrics.record_connect())
+    event.listen(engine, 'invalidate', lambda dbapi_connection, record, exception: metrics.record_invalidation())
+
+
+def pool_metrics():
+    """Счетчики пулов всех движков текущего приложения: {bind: {...}}"""
+    return {bind or 'default': engine.pool.metrics.snapshot(engine.pool)
+            for bind, engine in db.engines.items() if getattr(engine.pool, 'metrics', None) is not None}
+
+
+# Маршрутизация чтений на реплику (DATABASE_REPLICA_URL)
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+class ReplicaRoutingMetrics:
+    """Решения маршрутизации между основной базой и репликой в пределах процесса"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions = Counter()
+        self.switched = 0
+
+    def init_app(self, app):
+        app.extensions['replica_metrics'] = self
+
+    def record(self, route, reason):
+        with self._lock:
+            self.decisions[route, reason] += 1
+
+    def record_switch(self):
+        with self._lock:
+            self.switched += 1
+
+    def reset(self):
+        with self._lock:
+            self.decisions.clear()
+            self.switched = 0
+
+    def snapshot(self):
+        with self._lock:
+            data = {'replica': {}, 'primary': {}, 'switched_to_primary': self.switched}
+            for (route, reason), count in self.decisions.items():
+                data[route][reason] = count
+        return data
+
+
+replica_metrics = app_extension('replica_metrics')
+
+
+def primary_only(view):
+    """Для представлений, которые меняют данные на GET-запрос: читают сразу с основной базы"""
+    view.db_primary = True
+    return view
+
+
+def select_db_route():
+    """'replica' или 'primary' для текущего запроса; решение попадает в счетчики"""
+    if not current_app.config['DATABASE_REPLICA_URL']:
+        return 'primary'
+    view = current_app.view_functions.get(request.endpoint)
+    if request.method not in READ_METHODS:
+        reason = 'write_method'
+    elif getattr(view, 'db_primary', False):
+        reason = 'primary_view'
+    elif session.get('_db_primary_until', 0) > time.time():
+        reason = 'read_your_writes'
+    else:
+        reason = 'read'
+    route = 'replica' if reason == 'read' else 'primary'
+    replica_metrics.record(route, reason)
+    return route
+
+
+def start_db_route():
+    if 'db_route' not in g:
+        g.db_route = select_db_route()
+
+
+def finish_db_route(response):
+    if g.get('db_wrote') and current_app.config['DATABASE_REPLICA_URL']:
+        # Реплика может отставать: ближайшие запросы этого пользователя читают с основной базы
+        session['_db_primary_until'] = time.time() + current_app.config['DB_READ_YOUR_WRITES']
+    if current_app.config['DATABASE_REPLICA_URL'] and current_app.config['SQL_STATS_HEADERS'] and 'db_route' in g:
+        response.headers.add('Server-Timing', f'db-route;desc="{g.db_route}"')
+    return response
+
+
+def _mark_db_write():
+    if has_request_context():
+        if g.get('db_route') == 'replica':
+            replica_metrics.record_switch()
+        # Все последующие чтения запроса — с основной базы, где уже видна запись
+        g.db_route = 'primary'
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _route_after_flush(session, flush_context):
+    _mark_db_write()
+
+
+@event.listens_for(RoutingSession, 'do_orm_execute')
+def _route_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _mark_db_write()
+
 
 # Удаляем дублирующиеся определения функций и инициализаций
 # Все необходимые функции и инициализации уже определены ранее
 
+class IdentityCache:
+    """LRU-кэш с TTL для пользователя вместе с его ролью.
+
+    Хранятся только значения колонок, а не ORM-объекты: на каждый запрос
+    из них собирается экземпляр и присоединяется к сессии без обращения к БД.
+    Вместе с записью хранится поколение таблиц user и role из кэша ответов: коммит
+    в любом процессе (при общем бэкенде sqlite) увеличивает его, и запись перестает выдаваться.
+    """
+
+    TABLES = ('user', 'role')
+
+    def __init__(self, ttl=60, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def init_app(self, app):
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        self.maxsize = app.config['IDENTITY_CACHE_SIZE']
+        app.extensions['identity_cache'] = self
+
+    @staticmethod
+    def _columns(obj):
+        return {column.key: getattr(obj, column.key) for column in obj.__mapper__.column_attrs}
+
+    def generation(self):
+        """Текущее поколение таблиц user/role; читается до загрузки пользователя из БД"""
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return None
+        return response_cache.generations(self.TABLES)
+
+    def get(self, user_id, generation=None):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, entry_generation, user_columns, role_columns = entry
+            if expires_at < time.monotonic() or entry_generation != generation:
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user_columns, role_columns
+
+    def put(self, user, generation=None):
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return
+        entry = (time.monotonic() + self.ttl, generation, self._columns(user),
+                 self._columns(user.role) if user.role else None)
+        with self._lock:
+            self._entries[user.id] = entry
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_users(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+
+    def invalidate_roles(self, role_ids):
+        with self._lock:
+            for user_id, (_, _, _, role_columns) in list(self._entries.items()):
+                if role_columns and role_columns['id'] in role_ids:
+                    del self._entries[user_id]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = app_extension('identity_cache')
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хеширования паролей переполнена"""
+
+
+class PasswordHasher:
+    """Хеширование и проверка паролей в ограниченном пуле потоков.
+
+    hashlib отпускает GIL во время PBKDF2/scrypt, поэтому вычисления идут параллельно,
+    а число одновременных вычислений ограничено размером пула, и всплеск входов
+    не занимает все ядра. Если в очереди больше max_pending задач, ожидание
+    ограничено timeout, после чего выбрасывается PasswordHasherBusy.
+    """
+
+    def __init__(self, method='pbkdf2:sha256:600000', workers=2, max_pending=16, timeout=5):
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self.configure(method, workers, max_pending, timeout)
+
+    def configure(self, method, workers, max_pending, timeout):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._prefix = None
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def init_app(self, app):
+        self.configure(app.config['PASSWORD_HASH_METHOD'], app.config['PASSWORD_HASH_WORKERS'],
+                       app.config['PASSWORD_HASH_MAX_PENDING'], app.config['PASSWORD_HASH_TIMEOUT'])
+        app.extensions['password_hasher'] = self
+
+    def _get_executor(self):
+        # Пул создается лениво и заново после fork — потоки не наследуются
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hasher')
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHasherBusy('Too many concurrent password operations')
+        try:
+            return self._get_executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        return self._run(check_password_hash, password_hash, password)
+
+    def hash_many(self, passwords, method=None):
+        """Хеширует список паролей параллельно на всем пуле (для массовой загрузки)"""
+        method = method or self.method
+        return list(self._get_executor().map(lambda password: generate_password_hash(password, method), passwords))
+
+    def needs_rehash(self, password_hash):
+        """True, если хеш создан другим алгоритмом или с другой стоимостью"""
+        if self._prefix is None:
+            # Каноническая запись метода с параметрами, например pbkdf2:sha256:600000
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return password_hash.split('$', 1)[0] != self._prefix
+
+
+password_hasher = app_extension('password_hasher')
+
+
+def password_hasher_busy(error):
+    logger.warning('Password hasher busy: %s', error)
+    return {'message': 'Server is busy, please retry'}, 503, {'Retry-After': '1'}
+
+
+def _attach_cached_user(user_columns, role_columns):
+    """Собирает User/Role из кэша и присоединяет к текущей сессии без SELECT"""
+    role = None
+    if role_columns is not None:
+        role = Role(**role_columns)
+        make_transient_to_detached(role)
+    user = User(**user_columns)
+    # Без событий backref, чтобы не пометить role.users как загруженную коллекцию
+    set_committed_value(user, 'role', role)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+
+@event.listens_for(SASession, 'after_flush')
+def _collect_identity_changes(session, flush_context):
+    changed = session.info.setdefault('identity_changes', (set(), set()))
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed[0].add(obj.id)
+        elif isinstance(obj, Role):
+            changed[1].add(obj.id)
+
+
+@event.listens_for(SASession, 'after_commit')
+def _apply_identity_changes(session):
+    user_ids, role_ids = session.info.pop('identity_changes', (set(), set()))
+    if user_ids:
+        identity_cache.invalidate_users(user_ids)
+    if role_ids:
+        identity_cache.invalidate_roles(role_ids)
+
+
+@event.listens_for(SASession, 'after_rollback')
+def _discard_identity_changes(session):
+    session.info.pop('identity_changes', None)
+
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    generation = identity_cache.generation()
+    cached = identity_cache.get(user_id, generation)
+    if cached is not None:
+        return _attach_cached_user(*cached)
+    user = db.session.get(User, user_id, options=[db.joinedload(User.role)])
+    if user is not None:
+        identity_cache.put(user, generation)
+    return user
 
 def is_admin():
     """Проверяет, является ли текущий пользователь администратором"""
@@ -97,18 +1031,85 @@ def is_admin():
 #     logger.debug(f"Getting option: {name} = {result} (category: {category})")
 #     return result
 
-# @app.template_global()
+# @web_bp.app_template_global()
 # def get_option(name, default=None, user_id=None, category=None):
 #     option = Options.query.filter_by(name=name, user_id=user_id, category=category).first()
 #     result = option.value if option else default
 #     logger.debug(f"Getting option: {name} = {result} (category: {category})")
 #     return result
 
-@app.template_global()
+@web_bp.app_template_global()
 def get_g_value(attr_name, default=None):
     from flask import g
     return getattr(g, attr_name, default)
 
+# Статические ресурсы: имена с хешем содержимого и предсжатые варианты (build_assets.py)
+ASSET_IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+# Предпочтительный порядок кодировок для предсжатых файлов
+ASSET_ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _load_json(path, default):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def init_assets(app):
+    """Загружает манифест собранной статики и подменяет view для static"""
+    manifest = _load_json(os.path.join(app.static_folder, 'dist', 'manifest.json'), {})
+    if not manifest:
+        logger.info("static/dist/manifest.json не найден, статика отдается без хешей (python build_assets.py)")
+    app.extensions['assets'] = {
+        'manifest': manifest,
+        'vendor': _load_json(os.path.join(app.root_path, 'assets.json'), {'vendor': {}})['vendor'],
+    }
+    app.url_defaults(fingerprint_static_url)
+    app.view_functions['static'] = send_static_asset
+
+
+def fingerprint_static_url(endpoint, values):
+    """url_for('static', filename=...) возвращает имя с хешем, если файл собран"""
+    if endpoint == 'static' and 'filename' in values:
+        manifest = current_app.extensions['assets']['manifest']
+        values['filename'] = manifest.get(values['filename'], values['filename'])
+
+
+@web_bp.app_template_global()
+def is_vendored(package, path):
+    """True, если сторонняя библиотека скачана в static/vendor"""
+    return f'vendor/{package}/{path}' in current_app.extensions['assets']['manifest']
+
+
+@web_bp.app_template_global()
+def vendor_url(package, path):
+    """Локальная копия сторонней библиотеки или, если она не собрана, адрес на CDN"""
+    if is_vendored(package, path):
+        return url_for('static', filename=f'vendor/{package}/{path}')
+    return current_app.extensions['assets']['vendor'][package]['base'] + path
+
+
+def send_static_asset(filename):
+    """Отдача статики: для файлов с хешем — предсжатый вариант и бессрочное кэширование"""
+    if not filename.startswith('dist/'):
+        return current_app.send_static_file(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    encoding = None
+    for name, suffix in ASSET_ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(
+                safe_join(current_app.static_folder, filename + suffix) or ''):
+            encoding, filename = name, filename + suffix
+            break
+    response = send_from_directory(current_app.static_folder, filename, mimetype=mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = ASSET_IMMUTABLE_CACHE
+    response.expires = None
+    return response
+
 # def set_option(name, value, description='', user_id=None, category=None):
 #     logger.debug(f"Setting option: {name} = {value} (category: {category})")
 #     option = Options.query.filter_by(name=name, user_id=user_id, category=category).first()
@@ -123,7 +1124,7 @@ def get_g_value(attr_name, default=None):
 #     db.session.commit()
 
 # Flask-RESTX API setup
-api = Api(app, version='1.0', title='Todo API',
+api = Api(api_bp, version='1.0', title='Todo API',
           description='A comprehensive Todo API with user management, roles, and CRUD operations',
           doc='/api/docs')
 
@@ -131,6 +1132,7 @@ ns = api.namespace('api/todos', description='Todo operations')
 ns_options = api.namespace('api/options', description='Options operations')
 ns_users = api.namespace('api/users', description='User operations')
 ns_roles = api.namespace('api/roles', description='Role operations')
+ns_metrics = api.namespace('api/metrics', description='Process metrics (administrators only)')
 
 todo_model = api.model('Todo', {
     'id': fields.Integer(readonly=True, description='The todo unique identifier'),
@@ -142,144 +1144,1636 @@ todo_model = api.model('Todo', {
     'due_date': fields.DateTime(description='Due date for the todo')
 })
 
-option_model = api.model('Option', {
-    'id': fields.Integer(readonly=True, description='The option unique identifier'),
-    'name': fields.String(required=True, description='The option name'),
-    'description': fields.String(description='The option description'),
-    'user_id': fields.Integer(description='User ID (null for global options)'),
-    'category': fields.String(description='Option category'),
-    'value': fields.String(description='Option value')
-})
+todo_page_model = api.model('TodoPage', {
+    'items': fields.List(fields.Nested(todo_model), description='Todos on this page'),
+    'next_cursor': fields.String(description='Opaque cursor for the next page (null on the last page)'),
+    'limit': fields.Integer(description='Page size used for this response')
+})
+
+TODO_PAGE_DEFAULT_LIMIT = 50
+TODO_PAGE_MAX_LIMIT = 500
+
+todo_list_parser = reqparse.RequestParser()
+todo_list_parser.add_argument('cursor', type=str, location='args', help='Opaque cursor returned as next_cursor')
+todo_list_parser.add_argument('limit', type=inputs.int_range(1, TODO_PAGE_MAX_LIMIT), location='args',
+                              default=TODO_PAGE_DEFAULT_LIMIT, help='Page size')
+todo_list_parser.add_argument('completed', type=inputs.boolean, location='args', help='Filter by completion status')
+todo_list_parser.add_argument('due_after', type=inputs.datetime_from_iso8601, location='args',
+                              help='Only todos due at or after this ISO 8601 datetime')
+todo_list_parser.add_argument('due_before', type=inputs.datetime_from_iso8601, location='args',
+                              help='Only todos due before this ISO 8601 datetime')
+
+todo_search_hit_model = api.inherit('TodoSearchHit', todo_model, {
+    'rank': fields.Float(description='Relevance, higher is better')
+})
+
+todo_search_model = api.model('TodoSearchResults', {
+    'items': fields.List(fields.Nested(todo_search_hit_model)),
+    'total': fields.Integer(description='Total number of matches'),
+    'page': fields.Integer(description='Current page'),
+    'limit': fields.Integer(description='Page size')
+})
+
+todo_search_parser = reqparse.RequestParser()
+todo_search_parser.add_argument('q', type=str, location='args', required=True,
+                                help='Search words; the last characters of each word match as a prefix')
+todo_search_parser.add_argument('page', type=inputs.positive, location='args', default=1, help='Page number')
+todo_search_parser.add_argument('limit', type=inputs.int_range(1, 100), location='args', default=20, help='Page size')
+
+TODO_BATCH_MAX_OPERATIONS = 5000
+
+todo_batch_operation_model = api.model('TodoBatchOperation', {
+    'op': fields.String(required=True, enum=['create', 'update', 'delete'], description='Operation type'),
+    'id': fields.Integer(description='Todo identifier (update and delete only)'),
+    'data': fields.Nested(todo_model, description='Todo fields (create and update only)')
+})
+
+todo_batch_model = api.model('TodoBatch', {
+    'operations': fields.List(fields.Nested(todo_batch_operation_model), required=True,
+                              description='Operations applied in a single transaction')
+})
+
+todo_batch_result_model = api.model('TodoBatchResult', {
+    'index': fields.Integer(description='Position of the operation in the request'),
+    'op': fields.String(description='Operation type'),
+    'id': fields.Integer(description='Todo identifier'),
+    'status': fields.Integer(description='HTTP-like status of the operation'),
+    'error': fields.String(description='Error message if the operation was rejected')
+})
+
+todo_batch_response_model = api.model('TodoBatchResponse', {
+    'committed': fields.Boolean(description='Whether the batch was applied'),
+    'results': fields.List(fields.Nested(todo_batch_result_model))
+})
+
+TODO_EXPORT_BATCH_SIZE = 1000
+TODO_EXPORT_COLUMNS = ['id', 'title', 'description', 'completed', 'created_at', 'updated_at', 'due_date']
+
+todo_export_parser = reqparse.RequestParser()
+todo_export_parser.add_argument('format', type=str, location='args', choices=('ndjson', 'csv'), default='ndjson',
+                                help='Export format: ndjson or csv')
+todo_export_parser.add_argument('completed', type=inputs.boolean, location='args', help='Filter by completion status')
+todo_export_parser.add_argument('due_after', type=inputs.datetime_from_iso8601, location='args',
+                                help='Only todos due at or after this ISO 8601 datetime')
+todo_export_parser.add_argument('due_before', type=inputs.datetime_from_iso8601, location='args',
+                                help='Only todos due before this ISO 8601 datetime')
+
+option_model = api.model('Option', {
+    'id': fields.Integer(readonly=True, description='The option unique identifier'),
+    'name': fields.String(required=True, description='The option name'),
+    'description': fields.String(description='The option description'),
+    'user_id': fields.Integer(description='User ID (null for global options)'),
+    'category': fields.String(description='Option category'),
+    'value': fields.String(description='Option value'),
+    'updated_at': fields.DateTime(readonly=True, description='Last update timestamp')
+})
+
+role_model = api.model('Role', {
+    'id': fields.Integer(readonly=True, description='The role unique identifier'),
+    'name': fields.String(required=True, description='The role name'),
+    'description': fields.String(description='The role description')
+})
+
+user_model = api.model('User', {
+    'id': fields.Integer(readonly=True, description='The user unique identifier'),
+    'username': fields.String(required=True, description='The username'),
+    'email': fields.String(required=True, description='The user email'),
+    'role_id': fields.Integer(required=True, description='The role ID'),
+    'role': fields.Nested(role_model, description='The user role'),
+    'created_at': fields.DateTime(readonly=True, description='Creation timestamp')
+})
+
+# Todo Model
+class Todo(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    completed = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    due_date = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        # Keyset pagination in the API walks todos in (created_at, id) order
+        db.Index('ix_todo_created_at_id', 'created_at', 'id'),
+        # Фильтры completed / due_date в API и подсчет просроченных задач
+        db.Index('ix_todo_completed_due_date', 'completed', 'due_date'),
+        db.Index('ix_todo_due_date', 'due_date'),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'completed': self.completed,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'due_date': self.due_date.isoformat() if self.due_date else None
+        }
+
+# Role Model
+class Role(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(50), unique=True, nullable=False)
+    description = db.Column(db.String(200))
+
+    def __repr__(self):
+        return f'<Role {self.name}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description
+        }
+
+# User Model
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    username = db.Column(db.String(64), unique=True, nullable=False)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
+    role = db.relationship('Role', backref=db.backref('users', lazy=True))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_user_role_id', 'role_id'),)
+
+    def set_password(self, password):
+        self.password_hash = password_hasher.hash(password)
+
+    def check_password(self, password):
+        return password_hasher.verify(self.password_hash, password)
+
+    def __repr__(self):
+        return f'<User {self.username}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'role_id': self.role_id,
+            'role': self.role.to_dict() if self.role else None,
+            'created_at': self.created_at.isoformat()
+        }
+
+# Options Model
+class Options(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    description = db.Column(db.Text)
+    user_id = db.Column(db.Integer, nullable=True)  # None for global options
+    category = db.Column(db.String(50))
+    value = db.Column(db.Text)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Настройки ищутся по (user_id, category), в т.ч. глобальные с user_id IS NULL
+    __table_args__ = (db.Index('ix_options_user_id_category', 'user_id', 'category'),)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'user_id': self.user_id,
+            'category': self.category,
+            'value': self.value,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+
+# GeoGuessr Score Model
+class GeoGuessrScore(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user = db.relationship('User', backref=db.backref('geoguessr_scores', lazy=True))
+    total_score = db.Column(db.Integer, nullable=False)
+    games_played = db.Column(db.Integer, default=1)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Набор раундов, выданный сервером (issue_round_set); один набор засчитывается один раз
+    round_id = db.Column(db.String(32), nullable=True)
+
+    __table_args__ = (
+        # Топ результатов: ORDER BY total_score DESC LIMIT 100
+        db.Index('ix_geo_guessr_score_total_score', 'total_score'),
+        # Результаты пользователя, в т.ч. лучший результат
+        db.Index('ix_geo_guessr_score_user_id_total_score', 'user_id', 'total_score'),
+        db.Index('ix_geo_guessr_score_round_id', 'round_id', unique=True),
+    )
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'user': self.user.to_dict() if self.user else None,
+            'total_score': self.total_score,
+            'games_played': self.games_played,
+            'created_at': self.created_at.isoformat()
+        }
+
+# Сводка GeoGuessr по пользователю: обновляется при сохранении результата,
+# чтобы таблица лидеров не агрегировала все игры на каждый запрос
+class GeoGuessrUserStats(db.Model):
+    __tablename__ = 'geo_guessr_user_stats'
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    games_played = db.Column(db.Integer, nullable=False, default=0)
+    total_score = db.Column(db.BigInteger, nullable=False, default=0)
+    best_score = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Ранг считается как число игроков с лучшим результатом выше — диапазон по индексу
+    __table_args__ = (db.Index('ix_geo_guessr_user_stats_best_score', 'best_score'),)
+
+    @property
+    def avg_score(self):
+        return self.total_score / self.games_played if self.games_played else 0
+
+    def rank(self):
+        better = db.session.scalar(
+            db.select(db.func.count()).select_from(GeoGuessrUserStats)
+            .where(GeoGuessrUserStats.best_score > self.best_score)
+        )
+        return better + 1
+
+    @staticmethod
+    def rebuild():
+        """Пересчитывает сводку целиком по таблице результатов (после массовой загрузки)"""
+        db.session.execute(db.delete(GeoGuessrUserStats))
+        db.session.execute(db.insert(GeoGuessrUserStats).from_select(
+            ['user_id', 'games_played', 'total_score', 'best_score', 'updated_at'],
+            db.select(GeoGuessrScore.user_id,
+                      db.func.coalesce(db.func.sum(GeoGuessrScore.games_played), 0),
+                      db.func.sum(GeoGuessrScore.total_score),
+                      db.func.max(GeoGuessrScore.total_score),
+                      db.func.max(GeoGuessrScore.created_at))
+            .group_by(GeoGuessrScore.user_id)
+        ))
+        db.session.commit()
+
+    @staticmethod
+    def record_score(user_id, total_score, games_played=1, best_score=None):
+        """Атомарно добавляет результат игры в сводку (UPSERT в текущей транзакции).
+
+        Для пачки игр total_score — сумма, best_score — лучший результат пачки.
+        """
+        now = datetime.utcnow()
+        if best_score is None:
+            best_score = total_score
+        dialect = db.session.get_bind().dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(GeoGuessrUserStats).values(
+                user_id=user_id, games_played=games_played, total_score=total_score,
+                best_score=best_score, updated_at=now
+            )
+            table = GeoGuessrUserStats.__table__
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.user_id],
+                set_={
+                    'games_played': table.c.games_played + stmt.excluded.games_played,
+                    'total_score': table.c.total_score + stmt.excluded.total_score,
+                    'best_score': db.case(
+                        (stmt.excluded.best_score > table.c.best_score, stmt.excluded.best_score),
+                        else_=table.c.best_score
+                    ),
+                    'updated_at': now
+                }
+            )
+            db.session.execute(stmt)
+            return
+        # Прочие СУБД: UPDATE, а при отсутствии строки — INSERT
+        updated = db.session.execute(
+            db.update(GeoGuessrUserStats)
+            .where(GeoGuessrUserStats.user_id == user_id)
+            .values(
+                games_played=GeoGuessrUserStats.games_played + games_played,
+                total_score=GeoGuessrUserStats.total_score + total_score,
+                best_score=db.case(
+                    (GeoGuessrUserStats.best_score < best_score, best_score),
+                    else_=GeoGuessrUserStats.best_score
+                ),
+                updated_at=now
+            )
+        ).rowcount
+        if not updated:
+            db.session.add(GeoGuessrUserStats(
+                user_id=user_id, games_played=games_played, total_score=total_score,
+                best_score=best_score, updated_at=now
+            ))
+
+# Раунды GeoGuessr: локации выдает и подписывает сервер, очки по присланным догадкам считает он же
+GEOGUESSR_ROUNDS = 5
+GEOGUESSR_MAX_ROUND_SCORE = 5000
+# Радиус Земли как в google.maps.geometry.spherical, которой раньше считал браузер
+EARTH_RADIUS_M = 6378137.0
+# Очки убывают в e раз на каждые 2000 км (20000 км / 10, как в прежней формуле клиента)
+SCORE_DECAY_M = 2000000.0
+
+GEOGUESSR_LOCATIONS = [
+    (48.8584, 2.2945),  # Париж, Эйфелева башня
+    (40.7580, -73.9855),  # Нью-Йорк, Таймс-сквер
+    (51.5007, -0.1246),  # Лондон, Биг-Бен
+    (35.6762, 139.6503),  # Токио
+    (-33.8688, 151.2093),  # Сидней, Опера
+    (41.8902, 12.4922),  # Рим, Колизей
+    (55.7558, 37.6173),  # Москва, Красная площадь
+    (37.9838, 23.7275),  # Афины, Акрополь
+    (25.1972, 55.2744),  # Дубай
+    (-22.9519, -43.2105),  # Рио-де-Жанейро
+]
+
+
+def haversine_distances(lat1, lng1, lat2, lng2):
+    """Расстояния по большому кругу в метрах между массивами точек (градусы)"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=np.float64)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def round_scores(distances):
+    """Очки раунда по расстоянию: 5000 за точное попадание, экспоненциальное убывание"""
+    # floor(x + 0.5) — то же округление, что Math.round в прежнем клиентском коде
+    return np.floor(GEOGUESSR_MAX_ROUND_SCORE * np.exp(-np.asarray(distances) / SCORE_DECAY_M) + 0.5).astype(np.int64)
+
+
+def score_games(locations, guesses):
+    """Очки сразу для пачки игр.
+
+    locations и guesses — массивы формы (игры, раунды, 2) из пар (lat, lng).
+    Возвращает (расстояния, очки раундов, сумму очков каждой игры).
+    """
+    locations = np.asarray(locations, dtype=np.float64)
+    guesses = np.asarray(guesses, dtype=np.float64)
+    distances = haversine_distances(locations[..., 0], locations[..., 1], guesses[..., 0], guesses[..., 1])
+    scores = round_scores(distances)
+    return distances, scores, scores.sum(axis=-1)
+
+
+# Каталог локаций GeoGuessr: бинарный файл, который каждый процесс отображает в память (np.memmap).
+# Страницы файла делят между собой все рабочие процессы через page cache ОС.
+#
+# Формат: CATALOG_MAGIC, длина заголовка (uint32 LE), JSON-заголовок, затем массивы с выравниванием
+# CATALOG_ALIGN байт. Смещения, типы и длины массивов записаны в заголовке:
+#   records       — LOCATION_DTYPE, отсортированы по ячейке сетки
+#   cell_start    — начало ячейки в records (CSR-индекс сетки grid_deg x grid_deg градусов)
+#   strata        — номера записей, отсортированные по (регион, сложность)
+#   stratum_start — начало страты в strata; страта = регион * difficulties + сложность
+CATALOG_MAGIC = b'GEOCAT01'
+CATALOG_ALIGN = 64
+LOCATION_DTYPE = np.dtype([('lat', '<f4'), ('lng', '<f4'), ('region', 'u1'), ('difficulty', 'u1')])
+# Километров в градусе широты
+KM_PER_DEGREE = EARTH_RADIUS_M * np.pi / 180 / 1000
+
+
+def catalog_grid(grid_deg):
+    """(строк, столбцов) сетки с шагом grid_deg градусов"""
+    return int(np.ceil(180 / grid_deg)), int(np.ceil(360 / grid_deg))
+
+
+def catalog_cells(lat, lng, grid_deg):
+    """Номера ячеек сетки для массивов координат"""
+    rows, cols = catalog_grid(grid_deg)
+    row = np.clip(np.floor((np.asarray(lat, dtype=np.float64) + 90) / grid_deg), 0, rows - 1).astype(np.int64)
+    col = np.floor((np.asarray(lng, dtype=np.float64) + 180) / grid_deg).astype(np.int64) % cols
+    return row * cols + col
+
+
+def build_location_catalog(rows, path, grid_deg=1.0):
+    """Пишет каталог из строк {'lat', 'lng', 'region'[, 'difficulty']}; возвращает заголовок.
+
+    Файл пишется рядом и подменяется через os.replace: процессы, которые уже отобразили
+    прежний файл, дочитывают его, новые запросы откроют новый (LocationCatalogs.get).
+    """
+    lats, lngs, region_names, difficulties = [], [], [], []
+    for line, row in enumerate(rows, start=1):
+        try:
+            lat, lng = float(row['lat']), float(row['lng'])
+            difficulty = int(row.get('difficulty') or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f'Row {line}: expected numeric lat, lng and optional integer difficulty')
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise ValueError(f'Row {line}: coordinates out of range: {lat}, {lng}')
+        if not 0 <= difficulty <= 255:
+            raise ValueError(f'Row {line}: difficulty must be 0..255')
+        lats.append(lat)
+        lngs.append(lng)
+        region_names.append(str(row.get('region') or '').strip())
+        difficulties.append(difficulty)
+    if not lats:
+        raise ValueError('No locations to write')
+    regions, region_codes = np.unique(np.array(region_names, dtype=object), return_inverse=True)
+    if len(regions) > 256:
+        raise ValueError(f'At most 256 regions are supported, got {len(regions)}')
+
+    records = np.empty(len(lats), dtype=LOCATION_DTYPE)
+    records['lat'], records['lng'] = lats, lngs
+    records['region'], records['difficulty'] = region_codes, difficulties
+    # Ячейки считаются по float32-координатам, как их потом прочитает LocationCatalog
+    cells = catalog_cells(records['lat'], records['lng'], grid_deg)
+    order = np.argsort(cells, kind='stable')
+    records, cells = records[order], cells[order]
+    grid_rows, grid_cols = catalog_grid(grid_deg)
+    cell_start = np.searchsorted(cells, np.arange(grid_rows * grid_cols + 1)).astype('<u4')
+
+    levels = int(records['difficulty'].max()) + 1
+    strata_keys = records['region'].astype(np.int64) * levels + records['difficulty']
+    strata = np.argsort(strata_keys, kind='stable').astype('<u4')
+    stratum_start = np.searchsorted(strata_keys[strata], np.arange(len(regions) * levels + 1)).astype('<u4')
+
+    arrays = {'records': records, 'cell_start': cell_start, 'strata': strata, 'stratum_start': stratum_start}
+    header = {
+        'id': uuid.uuid4().hex, 'count': len(records), 'grid_deg': grid_deg,
+        'regions': [str(region) for region in regions], 'difficulties': levels, 'arrays': {},
+    }
+    # Смещения массивов зависят от длины заголовка, а она — от смещений: повторяем, пока заголовок не поместится
+    data_start = 0
+    while True:
+        offset = data_start
+        for name, array in arrays.items():
+            header['arrays'][name] = {'offset': offset, 'dtype': np.lib.format.dtype_to_descr(array.dtype),
+                                     'length': len(array)}
+            offset = -(-(offset + array.nbytes) // CATALOG_ALIGN) * CATALOG_ALIGN
+        encoded = json.dumps(header).encode('utf-8')
+        header_end = -(-(len(CATALOG_MAGIC) + 4 + len(encoded)) // CATALOG_ALIGN) * CATALOG_ALIGN
+        if header_end <= data_start:
+            break
+        data_start = header_end
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(CATALOG_MAGIC + len(encoded).to_bytes(4, 'little') + encoded)
+        for name, array in arrays.items():
+            f.seek(header['arrays'][name]['offset'])
+            f.write(array.tobytes())
+        f.truncate(offset)
+    os.replace(tmp_path, path)
+    return header
+
+
+class LocationCatalog:
+    """Каталог локаций, отображенный в память только для чтения"""
+
+    def __init__(self, path):
+        self.path = path
+        self.buffer = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.buffer[:len(CATALOG_MAGIC)]) != CATALOG_MAGIC:
+            raise ValueError(f'{path} is not a location catalog')
+        start = len(CATALOG_MAGIC) + 4
+        length = int.from_bytes(bytes(self.buffer[len(CATALOG_MAGIC):start]), 'little')
+        header = json.loads(bytes(self.buffer[start:start + length]))
+        self.id = header['id']
+        self.grid_deg = header['grid_deg']
+        self.grid_rows, self.grid_cols = catalog_grid(self.grid_deg)
+        self.regions = header['regions']
+        self.region_codes = {name: code for code, name in enumerate(self.regions)}
+        self.difficulties = header['difficulties']
+        for name, spec in header['arrays'].items():
+            dtype = np.lib.format.descr_to_dtype(spec['dtype'])
+            end = spec['offset'] + spec['length'] * dtype.itemsize
+            # Представления поверх общего отображения: данные не копируются в память процесса
+            # (np.asarray — обычный ndarray без накладных расходов подкласса memmap на каждую операцию)
+            setattr(self, name, np.asarray(self.buffer[spec['offset']:end]).view(dtype))
+        self._ranges = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def location(self, index):
+        """(lat, lng) записи в виде чисел Python с точностью float32 (~1 м)"""
+        record = self.records[index]
+        return round(float(record['lat']), 5), round(float(record['lng']), 5)
+
+    def cells_of(self, indices):
+        """Ячейки сетки записей: записи отсортированы по ячейкам, поэтому хватает бинарного поиска"""
+        # Тип индексов совпадает с cell_start, иначе numpy приводит к общему типу весь массив
+        return np.searchsorted(self.cell_start, np.asarray(indices, dtype=self.cell_start.dtype), side='right') - 1
+
+    def cell_of(self, index):
+        return int(self.cells_of(index))
+
+    def stratum_ranges(self, region=None, difficulty=None):
+        """Диапазоны strata для региона/сложности и накопленные размеры для выбора за O(1)"""
+        key = (region, difficulty)
+        if key not in self._ranges:
+            if region is not None and region not in self.region_codes:
+                raise ValueError(f'Unknown region: {region}')
+            if difficulty is not None and not 0 <= difficulty < self.difficulties:
+                raise ValueError(f'Difficulty must be 0..{self.difficulties - 1}')
+            codes = range(len(self.regions)) if region is None else [self.region_codes[region]]
+            levels = range(self.difficulties) if difficulty is None else [difficulty]
+            ranges = []
+            for code in codes:
+                strata = [code * self.difficulties + level for level in levels]
+                # Страты одного региона идут подряд: без фильтра по сложности это один диапазон
+                start, end = int(self.stratum_start[strata[0]]), int(self.stratum_start[strata[-1] + 1])
+                if start < end:
+                    ranges.append((start, end))
+            totals = list(itertools.accumulate(end - start for start, end in ranges))
+            self._ranges[key] = (ranges, totals)
+        return self._ranges[key]
+
+    def draw(self, region=None, difficulty=None):
+        """Случайная запись страты; None, если страта пуста"""
+        ranges, totals = self.stratum_ranges(region, difficulty)
+        if not totals:
+            return None
+        pick = random.randrange(totals[-1])
+        slot = bisect.bisect_right(totals, pick)
+        start, end = ranges[slot]
+        return int(self.strata[end - (totals[slot] - pick)])
+
+    def near(self, lat, lng, radius_km, limit=None):
+        """Номера записей в радиусе radius_km от точки, ближайшие первыми"""
+        lat_span = radius_km / KM_PER_DEGREE
+        low, high = max(lat - lat_span, -90.0), min(lat + lat_span, 90.0)
+        first_row = int(np.clip((low + 90) // self.grid_deg, 0, self.grid_rows - 1))
+        last_row = int(np.clip((high + 90) // self.grid_deg, 0, self.grid_rows - 1))
+        widest = np.cos(np.radians(max(abs(low), abs(high))))
+        lng_span = lat_span / widest if widest > 1e-9 else 180.0
+        if lng_span >= 180:
+            col_spans = [(0, self.grid_cols - 1)]
+        else:
+            first_col = int(((lng - lng_span + 180) // self.grid_deg) % self.grid_cols)
+            last_col = int(((lng + lng_span + 180) // self.grid_deg) % self.grid_cols)
+            # Окно через антимеридиан — два отрезка столбцов
+            col_spans = ([(first_col, last_col)] if first_col <= last_col
+                         else [(first_col, self.grid_cols - 1), (0, last_col)])
+        # Ячейки строки идут подряд, поэтому каждый отрезок столбцов — один срез records
+        slices = [np.arange(self.cell_start[row * self.grid_cols + start], self.cell_start[row * self.grid_cols + end + 1])
+                  for row in range(first_row, last_row + 1) for start, end in col_spans]
+        candidates = np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+        records = self.records[candidates]
+        distances = haversine_distances(lat, lng, records['lat'], records['lng'])
+        inside = distances <= radius_km * 1000
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')[:limit]
+        return candidates[order]
+
+    def sample(self, count, region=None, difficulty=None, near=None, radius_km=500.0, exclude=()):
+        """count разных записей: случайных по страте или в радиусе от near=(lat, lng).
+
+        exclude — номера недавно сыгранных записей: их ячейки сетки пропускаются, пока хватает других.
+        """
+        if near is not None:
+            pool = self.near(near[0], near[1], radius_km)
+            records = self.records[pool]
+            mask = np.ones(len(pool), dtype=bool)
+            if region is not None:
+                if region not in self.region_codes:
+                    raise ValueError(f'Unknown region: {region}')
+                mask &= records['region'] == self.region_codes[region]
+            if difficulty is not None:
+                mask &= records['difficulty'] == difficulty
+            pool = pool[mask]
+            draw = (lambda: int(pool[random.randrange(len(pool))])) if len(pool) else (lambda: None)
+        else:
+            draw = lambda: self.draw(region, difficulty)  # noqa: E731
+        excluded_cells = set(self.cells_of([index for index in exclude if 0 <= index < len(self)]).tolist())
+        chosen, cells = [], set()
+        # Сначала — без недавних ячеек и без повторов ячеек в наборе, затем без этих ограничений
+        for strict in (True, False):
+            for _ in range(count * 32):
+                if len(chosen) == count:
+                    return chosen
+                index = draw()
+                if index is None:
+                    break
+                if index in chosen:
+                    continue
+                cell = self.cell_of(index)
+                if strict and (cell in excluded_cells or cell in cells):
+                    continue
+                chosen.append(index)
+                cells.add(cell)
+        if len(chosen) < count:
+            raise ValueError(f'Not enough locations match the filters (found {len(chosen)} of {count})')
+        return chosen
+
+    def snapshot(self):
+        return {'path': self.path, 'id': self.id, 'locations': len(self), 'bytes': len(self.buffer),
+                'regions': len(self.regions), 'difficulties': self.difficulties, 'grid_deg': self.grid_deg}
+
+
+class LocationCatalogs:
+    """Каталоги, открытые процессом; файл, подмененный build-location-catalog, открывается заново"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}
+
+    def get(self, path):
+        """Каталог по пути или None, если файла нет"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        version = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        entry = self._open.get(path)
+        if entry is None or entry[0] != version:
+            with self._lock:
+                entry = self._open.get(path)
+                if entry is None or entry[0] != version:
+                    entry = (version, LocationCatalog(path))
+                    self._open[path] = entry
+                    logger.info('Location catalog %s: %d locations', path, len(entry[1]))
+        return entry[1]
+
+
+location_catalogs = LocationCatalogs()
+
+
+def current_location_catalog():
+    return location_catalogs.get(current_app.config['GEOGUESSR_CATALOG_PATH'])
+
+
+def _round_serializer():
+    # v2: в токене номера локаций, а не координаты; токены прежнего формата не принимаются
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt='geoguessr-rounds-v2')
+
+
+def pick_round_locations(region=None, difficulty=None, near=None, radius_km=500.0, recent=()):
+    """Локации набора раундов: (id каталога, [номера записей в каталоге]).
+
+    Без каталога (GEOGUESSR_CATALOG_PATH не собран) — id None и номера в GEOGUESSR_LOCATIONS, фильтры недоступны.
+    """
+    catalog = current_location_catalog()
+    if catalog is None:
+        if region is not None or difficulty is not None or near is not None:
+            raise ValueError('Location catalog is not available, run flask build-location-catalog')
+        return None, random.sample(range(len(GEOGUESSR_LOCATIONS)), GEOGUESSR_ROUNDS)
+    return catalog.id, catalog.sample(GEOGUESSR_ROUNDS, region, difficulty, near, radius_km, exclude=recent)
+
+
+def round_location(catalog_id, location_id):
+    """[lat, lng] локации по номеру; ValueError, если каталог пересобран после выдачи набора раундов"""
+    if catalog_id is None:
+        return list(GEOGUESSR_LOCATIONS[location_id])
+    catalog = current_location_catalog()
+    if catalog is None or catalog.id != catalog_id:
+        raise ValueError('Location catalog has been rebuilt, start a new game')
+    return list(catalog.location(location_id))
+
+
+def issue_round_set(user_id, catalog_id=None, location_ids=None):
+    """Новый набор раундов: подписанный токен с номерами локаций и число раундов.
+
+    Координаты клиент получает по одному раунду через reveal_round, в конце игры токен возвращается с догадками.
+    """
+    if location_ids is None:
+        catalog_id, location_ids = pick_round_locations()
+    token = _round_serializer().dumps({'id': uuid.uuid4().hex, 'user': user_id, 'catalog': catalog_id,
+                                       'locations': location_ids})
+    return {'token': token, 'rounds': len(location_ids)}
+
+
+def load_round_set(token, user_id):
+    """Содержимое токена набора раундов; ValueError, если он неверен, истек или выдан другому пользователю"""
+    try:
+        round_set = _round_serializer().loads(token or '', max_age=current_app.config['GEOGUESSR_ROUND_TTL'])
+    except SignatureExpired:
+        raise ValueError('Round set has expired')
+    except BadSignature:
+        raise ValueError('Invalid round set token')
+    # Набор раундов привязан к пользователю, которому выдан: чужой токен не засчитывается
+    if round_set['user'] != user_id:
+        raise ValueError('Round set was issued to another user')
+    return round_set
+
+
+def reveal_round(round_set, number):
+    """[lat, lng] раунда number (с 1) для Street View; время первого показа раунда запоминается в сессии.
+
+    Раунды открываются по порядку; по этим отметкам check_round_timing узнает, сколько длился каждый раунд.
+    """
+    if not isinstance(number, int) or isinstance(number, bool) or not 1 <= number <= len(round_set['locations']):
+        raise ValueError(f"round must be 1..{len(round_set['locations'])}")
+    reveals = session.get('geoguessr_reveals')
+    if not reveals or reveals['id'] != round_set['id']:
+        reveals = {'id': round_set['id'], 'at': []}
+    if number > len(reveals['at']) + 1:
+        raise ValueError(f'Round {len(reveals["at"]) + 1} has not been played yet')
+    if number == len(reveals['at']) + 1:
+        reveals['at'].append(time.time())
+        session['geoguessr_reveals'] = reveals
+    return round_location(round_set['catalog'], round_set['locations'][number - 1])
+
+
+def check_round_timing(round_set, submitted_at):
+    """ValueError, если раунд не показывался или длился меньше GEOGUESSR_MIN_ROUND_SECONDS"""
+    min_seconds = current_app.config['GEOGUESSR_MIN_ROUND_SECONDS']
+    if min_seconds <= 0:
+        return
+    reveals = session.get('geoguessr_reveals')
+    shown = reveals['at'] if reveals and reveals['id'] == round_set['id'] else []
+    if len(shown) < len(round_set['locations']):
+        raise ValueError(f'Round {len(shown) + 1} was never shown')
+    # Раунд длится от своего показа до показа следующего, последний — до отправки результата
+    for number, (started, finished) in enumerate(zip(shown, shown[1:] + [submitted_at]), 1):
+        if finished - started < min_seconds:
+            raise ValueError(f'Round {number} was answered in {finished - started:.1f} s')
+
+
+def check_round_distances(distances):
+    """ValueError, если догадок ближе GEOGUESSR_PERFECT_DISTANCE_M к ответу больше GEOGUESSR_MAX_PERFECT_ROUNDS"""
+    limit = current_app.config['GEOGUESSR_PERFECT_DISTANCE_M']
+    perfect = int(np.count_nonzero(np.asarray(distances) <= limit))
+    if perfect > current_app.config['GEOGUESSR_MAX_PERFECT_ROUNDS']:
+        raise ValueError(f'{perfect} guesses within {limit:g} m of the answer')
+
+
+def parse_round_submission(data, user_id):
+    """(round_set, locations, guesses) из тела save_score; ValueError, если токен или догадки неверны"""
+    round_set = load_round_set(data.get('token'), user_id)
+    raw_guesses = data.get('guesses')
+    if not isinstance(raw_guesses, list) or len(raw_guesses) != len(round_set['locations']):
+        raise ValueError(f"Expected {len(round_set['locations'])} guesses")
+    guesses = []
+    for guess in raw_guesses:
+        lat, lng = (guess.get('lat'), guess.get('lng')) if isinstance(guess, dict) else (None, None)
+        if (not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in (lat, lng))
+                or not (-90 <= lat <= 90 and -180 <= lng <= 180)):
+            raise ValueError('Each guess must be {"lat": -90..90, "lng": -180..180}')
+        guesses.append([float(lat), float(lng)])
+    # Координаты ответов известны только серверу: токен хранит номера локаций
+    locations = [round_location(round_set['catalog'], location_id) for location_id in round_set['locations']]
+    return round_set, locations, guesses
+
+
+# Отложенная запись результатов GeoGuessr (SCORE_INGEST_MODE=batch)
+class ScoreIngestor:
+    """Запись результатов игр пачками в фоновом потоке (write-behind).
+
+    Запрос дописывает игру (набор раундов и догадки) в spool-файл процесса, кладет его в ограниченную очередь
+    и сразу получает идентификатор. Фоновый поток пишет очередь в БД многострочным INSERT,
+    когда набралось batch_size записей или прошло interval секунд. Spool-файл процесса,
+    который упал, не успев записать очередь, проигрывается при старте следующего процесса:
+    подтвержденные результаты не теряются (доставка — не менее одного раза).
+    """
+
+    # Формат записи spool: 2 — набор раундов и догадки (1 — присланный клиентом total_score)
+    RECORD_VERSION = 2
+
+    def __init__(self):
+        self.app = None
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stop = None
+        self._thread = None
+        self._spool_fd = None
+        self._spool_path = None
+        self._counters = Counter()
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config['SCORE_INGEST_MODE'] == 'batch'
+        self.batch_size = app.config['SCORE_BATCH_SIZE']
+        self.interval = app.config['SCORE_BATCH_INTERVAL']
+        self.queue_size = app.config['SCORE_QUEUE_SIZE']
+        self.spool = app.config['SCORE_SPOOL']
+        self.spool_dir = app.config['SCORE_SPOOL_DIR']
+        if self.spool not in ('off', 'write', 'fsync'):
+            raise ValueError(f'Unknown SCORE_SPOOL {self.spool!r}, expected off, write or fsync')
+        if self.enabled and self.spool != 'off' and fcntl is None:
+            logger.warning('SCORE_SPOOL needs fcntl (POSIX); scores are kept in memory only')
+            self.spool = 'off'
+        app.extensions['score_ingestor'] = self
+
+    def start(self):
+        """Поток записи текущего процесса (после fork — новый) и проигрывание осиротевших spool-файлов"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            self._stop = threading.Event()
+            self._counters = Counter()
+            if self.spool != 'off':
+                os.makedirs(self.spool_dir, exist_ok=True)
+                self._open_spool()
+                self._replay_orphans()
+            self._thread = threading.Thread(target=self._run, name='score-ingestor', daemon=True)
+            self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self, timeout=10):
+        """Дописывает очередь в БД и останавливает поток"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._spool_fd is None or self._thread.is_alive():
+            return
+        # Закрытие снимает блокировку: оставшийся файл проиграет следующий процесс
+        os.close(self._spool_fd)
+        self._spool_fd = None
+        if self._queue.empty() and not self._counters['unflushed']:
+            # Все записано: spool не нужен следующему процессу
+            os.remove(self._spool_path)
+        else:
+            logger.warning('%d GeoGuessr scores were not written, %s is kept for replay',
+                           self._counters['unflushed'] + self._queue.qsize(), self._spool_path)
+
+    def submit(self, user_id, round_id, locations, guesses):
+        """Ставит игру в очередь; None, если очередь заполнена (тогда запись синхронная).
+
+        Очки считаются при записи — сразу для всей пачки (score_games).
+        """
+        self.start()
+        record = {'version': self.RECORD_VERSION, 'id': uuid.uuid4().hex, 'user_id': user_id, 'round_id': round_id,
+                  'locations': locations, 'guesses': guesses, 'created_at': datetime.utcnow().isoformat()}
+        with self._spool_lock:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self._counters['overflow'] += 1
+                return None
+            self._append_spool(record)
+            self._counters['accepted'] += 1
+        return record['id']
+
+    def snapshot(self):
+        data = dict(self._counters)
+        data['queued'] = self._queue.qsize() if self._queue is not None else 0
+        data['spool'] = self.spool
+        return data
+
+    # Spool: одна строка JSON на результат и {"done": [...]} после записи пачки в БД
+    def _open_spool(self):
+        self._spool_path = os.path.join(self.spool_dir, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.ndjson')
+        self._spool_fd = os.open(self._spool_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        # Блокировка держится, пока процесс жив: по ней остальные отличают свой файл от осиротевшего
+        fcntl.flock(self._spool_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _append_spool(self, entry):
+        if self._spool_fd is None:
+            return
+        os.write(self._spool_fd, (json.dumps(entry) + '\n').encode('utf-8'))
+        if self.spool == 'fsync':
+            os.fsync(self._spool_fd)
+
+    def _checkpoint(self, batch):
+        if self._spool_fd is None:
+            return
+        with self._spool_lock:
+            if self._queue.empty() and not self._counters['unflushed']:
+                # Все подтвержденное уже в БД: файл можно начать заново
+                os.ftruncate(self._spool_fd, 0)
+            else:
+                self._append_spool({'done': [record['id'] for record in batch]})
+
+    def _pending(self, path):
+        records, done = {}, set()
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Строка, недописанная в момент сбоя
+                    continue
+                if 'done' in entry:
+                    done.update(entry['done'])
+                else:
+                    records[entry['id']] = entry
+        pending = [record for record_id, record in records.items() if record_id not in done]
+        supported = [record for record in pending if record.get('version') == self.RECORD_VERSION]
+        if len(supported) < len(pending):
+            # Записи другого формата (например, с total_score от клиента) проиграть нельзя
+            self._counters['skipped'] += len(pending) - len(supported)
+            logger.warning('Skipping %d GeoGuessr scores in an unsupported spool format in %s',
+                           len(pending) - len(supported), os.path.basename(path))
+        return supported
+
+    def _replay_orphans(self):
+        for name in sorted(os.listdir(self.spool_dir)):
+            path = os.path.join(self.spool_dir, name)
+            if not name.endswith('.ndjson') or path == self._spool_path:
+                continue
+            with open(path, 'a+b') as f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                pending = self._pending(path)
+                try:
+                    for start in range(0, len(pending), self.batch_size):
+                        batch = pending[start:start + self.batch_size]
+                        if not self._flush(batch, retry=False):
+                            # БД недоступна: файл остается и будет проигран при следующем старте
+                            return
+                except Exception:
+                    # Ошибка не должна мешать запуску процесса; записанное повторно отсеет уникальный round_id
+                    logger.exception('Replaying %s failed, the file is kept', name)
+                    continue
+                os.remove(path)
+            self._counters['replayed'] += len(pending)
+            logger.info('Replayed %d scores from %s', len(pending), name)
+
+    # Поток записи
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch:
+                try:
+                    flushed = self._flush(batch)
+                except Exception:
+                    # Не SQLAlchemyError (ошибка в данных, NumPy): поток не должен завершиться молча
+                    logger.exception('Writing %d GeoGuessr scores failed', len(batch))
+                    flushed = False
+                if flushed:
+                    self._checkpoint(batch)
+                else:
+                    # Пачка осталась только в spool: файл не удаляется и не обнуляется
+                    self._counters['unflushed'] += len(batch)
+            elif self._stop.is_set():
+                return
+
+    def _collect(self):
+        """Пачка из очереди: до batch_size записей или interval секунд с первой записи"""
+        batch = []
+        deadline = None
+        while len(batch) < self.batch_size:
+            if self._stop.is_set():
+                # Остановка: дописываем то, что уже в очереди, без ожидания
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+                continue
+            timeout = self.interval if deadline is None else deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+            if deadline is None:
+                deadline = time.monotonic() + self.interval
+        return batch
+
+    def _flush(self, batch, retry=True):
+        """Пишет пачку, повторяя при недоступной БД; False — пачка осталась только в spool"""
+        delay = 0.5
+        written = len(batch)
+        while True:
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+                break
+            except sa_exc.IntegrityError:
+                # Например, пользователь удален: пишем по одной и отбрасываем ошибочные
+                with self.app.app_context():
+                    for record in batch:
+                        try:
+                            self._write([record])
+                        except sa_exc.IntegrityError:
+                            written -= 1
+                            self._counters['rejected'] += 1
+                            # В том числе повторно присланный набор раундов (уникальный round_id)
+                            logger.error('Dropping GeoGuessr score %s of user %s', record['id'], record['user_id'])
+                break
+            except sa_exc.SQLAlchemyError:
+                if not retry or self._stop.is_set():
+                    logger.exception('Writing %d GeoGuessr scores failed, they stay in the spool', len(batch))
+                    return False
+                logger.exception('Writing %d GeoGuessr scores failed, retrying in %.1f s', len(batch), delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+        self._counters['written'] += written
+        self._counters['batches'] += 1
+        return True
+
+    @staticmethod
+    def _write(records):
+        _, _, totals = score_games([record['locations'] for record in records],
+                                   [record['guesses'] for record in records])
+        rows = [{'user_id': record['user_id'], 'total_score': int(total), 'games_played': 1,
+                 'round_id': record['round_id'], 'created_at': datetime.fromisoformat(record['created_at'])}
+                for record, total in zip(records, totals)]
+        summary = {}
+        for row in rows:
+            games, total, best = summary.get(row['user_id'], (0, 0, row['total_score']))
+            summary[row['user_id']] = (games + 1, total + row['total_score'], max(best, row['total_score']))
+        try:
+            # Один многострочный INSERT вместо INSERT + COMMIT на каждую игру
+            db.session.execute(GeoGuessrScore.__table__.insert(), rows)
+            for user_id, (games, total, best) in sorted(summary.items()):
+                GeoGuessrUserStats.record_score(user_id, total, games, best)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+score_ingestor = app_extension('score_ingestor')
+
+class TodoStats:
+    """Кэш статистики задач для дашборда.
+
+    Счетчики считаются одним агрегатным запросом и затем обновляются
+    инкрементально при создании, переключении, редактировании и удалении задач.
+    Количество просроченных задач зависит от текущего времени, поэтому вместе с ним
+    хранится ближайший будущий срок: пока он не наступил, счетчик остается точным.
+    Изменения из других процессов видны по поколению таблицы todo в кэше ответов
+    (общему при RESPONSE_CACHE_BACKEND=sqlite); без кэша ответов расхождение ограничивает TTL.
+    """
+
+    def __init__(self, ttl=60):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._stats = None
+        self._next_due = None
+        self._loaded_at = 0.0
+        self._generation = None
+
+    def init_app(self, app):
+        app.extensions['todo_stats'] = self
+
+    def _load(self, now):
+        pending = db.not_(db.func.coalesce(Todo.completed, False))
+        row = db.session.execute(db.select(
+            db.func.count(Todo.id),
+            db.func.count(Todo.id).filter(Todo.completed.is_(True)),
+            db.func.count(Todo.id).filter(pending, Todo.due_date < now),
+            db.func.min(Todo.due_date).filter(pending, Todo.due_date >= now)
+        )).one()
+        total, completed, overdue, next_due = row
+        self._stats = {'total': total, 'completed': completed, 'overdue': overdue}
+        self._next_due = next_due
+        self._loaded_at = time.monotonic()
+
+    def get(self):
+        """Возвращает total / completed / pending / overdue / completion_rate"""
+        now = datetime.utcnow()
+        # Поколение читается до COUNT: коммит между ними приведет к лишней перезагрузке, а не к устаревшим данным
+        generation = response_cache.generation(Todo.__table__.name)
+        with self._lock:
+            if (self._stats is None
+                    or generation != self._generation
+                    or time.monotonic() - self._loaded_at > self.ttl
+                    or (self._next_due is not None and self._next_due <= now)):
+                self._load(now)
+                self._generation = generation
+            stats = dict(self._stats)
+        stats['pending'] = stats['total'] - stats['completed']
+        stats['completion_rate'] = round(stats['completed'] * 100 / stats['total']) if stats['total'] else 0
+        return stats
+
+    @staticmethod
+    def snapshot(todo):
+        """Состояние задачи, влияющее на статистику: (completed, due_date)"""
+        return bool(todo.completed), todo.due_date
+
+    def record_change(self, before, after):
+        """Применяет изменение одной задачи; before/after — snapshot() или None"""
+        now = datetime.utcnow()
+        with self._lock:
+            if self._stats is None:
+                return
+            for state, sign in ((before, -1), (after, 1)):
+                if state is None:
+                    continue
+                completed, due_date = state
+                self._stats['total'] += sign
+                if completed:
+                    self._stats['completed'] += sign
+                elif due_date is not None:
+                    if due_date < now:
+                        self._stats['overdue'] += sign
+                    elif sign > 0 and (self._next_due is None or due_date < self._next_due):
+                        self._next_due = due_date
+
+    def invalidate(self):
+        with self._lock:
+            self._stats = None
+
+
+todo_stats = app_extension('todo_stats')
+
+
+def resolve_due_date(was_completed, new_completed, new_due_date):
+    """Возвращает due_date с учетом перехода статуса выполнения"""
+    # Команда: добавь возможность чтобы при включения чекбокса выполнения элемента автоматичесики выставлялась текущая дата выполнения, и при выключении, то дата убиралась
+    if new_completed and not was_completed:  # Переход из незавершенного в завершенное
+        if not new_due_date:  # Если дата не была указана вручную
+            return datetime.utcnow()  # Автоматически устанавливаем текущую дату
+    elif not new_completed and was_completed:  # Переход из завершенного в незавершенное
+        return None  # Убираем дату выполнения
+    return new_due_date
+
+
+# Полнотекстовый индекс по title/description: FTS5 на SQLite, tsvector + GIN на PostgreSQL.
+# Те же объекты создает миграция f1c6b8a2d5e4; здесь — для баз, созданных через db.create_all()
+TODO_SEARCH_DDL = {
+    'sqlite': [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS todo_fts USING fts5("
+        "title, description, content='todo', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER IF NOT EXISTS todo_fts_ai AFTER INSERT ON todo BEGIN "
+        "INSERT INTO todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "CREATE TRIGGER IF NOT EXISTS todo_fts_ad AFTER DELETE ON todo BEGIN "
+        "INSERT INTO todo_fts(todo_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); END",
+        "CREATE TRIGGER IF NOT EXISTS todo_fts_au AFTER UPDATE OF title, description ON todo BEGIN "
+        "INSERT INTO todo_fts(todo_fts, rowid, title, description) "
+        "VALUES ('delete', old.id, old.title, old.description); "
+        "INSERT INTO todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+        "INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')",
+    ],
+    'postgresql': [
+        "ALTER TABLE todo ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED",
+        "CREATE INDEX IF NOT EXISTS ix_todo_search_vector ON todo USING GIN (search_vector)",
+    ],
+}
+
+TODO_SEARCH_SQL = {
+    'sqlite': (
+        "SELECT rowid AS id, -bm25(todo_fts, 10.0, 1.0) AS rank FROM todo_fts "
+        "WHERE todo_fts MATCH :match ORDER BY rank DESC, rowid LIMIT :limit OFFSET :offset",
+        "SELECT count(*) FROM todo_fts WHERE todo_fts MATCH :match",
+    ),
+    'postgresql': (
+        "SELECT id, ts_rank(search_vector, to_tsquery('simple', :match)) AS rank FROM todo "
+        "WHERE search_vector @@ to_tsquery('simple', :match) ORDER BY rank DESC, id LIMIT :limit OFFSET :offset",
+        "SELECT count(*) FROM todo WHERE search_vector @@ to_tsquery('simple', :match)",
+    ),
+}
+
+TODO_SEARCH_MAX_TERMS = 8
+_search_backends = {}
+
+
+def todo_search_backend():
+    """'sqlite' / 'postgresql', если полнотекстовый индекс создан, иначе 'like'"""
+    bind = db.session.get_bind()
+    key = str(bind.url)
+    if key not in _search_backends:
+        dialect = bind.dialect.name
+        if dialect == 'sqlite':
+            found = db.session.execute(db.text(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'todo_fts'")).first()
+        elif dialect == 'postgresql':
+            found = db.session.execute(db.text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'todo' AND column_name = 'search_vector'")).first()
+        else:
+            found = None
+        _search_backends[key] = dialect if found else 'like'
+    return _search_backends[key]
+
+
+def create_todo_search_index():
+    """Создает полнотекстовый индекс, если его еще нет (для db.create_all())"""
+    dialect = db.session.get_bind().dialect.name
+    _search_backends.clear()
+    if dialect not in TODO_SEARCH_DDL or todo_search_backend() == dialect:
+        return
+    for statement in TODO_SEARCH_DDL[dialect]:
+        db.session.execute(db.text(statement))
+    db.session.commit()
+    _search_backends.clear()
+
+
+class TodoSearch:
+    """Поиск задач по словам запроса с ранжированием и префиксным совпадением"""
+
+    def __init__(self, query):
+        self.terms = re.findall(r'\w+', query or '')[:TODO_SEARCH_MAX_TERMS]
+        self.backend = todo_search_backend() if self.terms else None
+
+    def _match(self):
+        if self.backend == 'sqlite':
+            return ' '.join(f'"{term}"*' for term in self.terms)
+        return ' & '.join(f'{term}:*' for term in self.terms)
+
+    def _like_filter(self):
+        return db.and_(*[
+            db.or_(Todo.title.ilike(f'%{term}%'), Todo.description.ilike(f'%{term}%'))
+            for term in self.terms
+        ])
+
+    def results(self, limit, offset=0):
+        """Список (Todo, rank) в порядке убывания релевантности"""
+        if not self.terms:
+            return []
+        if self.backend == 'like':
+            todos = Todo.query.filter(self._like_filter()).order_by(Todo.id.desc()).limit(limit).offset(offset).all()
+            return [(todo, 0.0) for todo in todos]
+        rows = db.session.execute(db.text(TODO_SEARCH_SQL[self.backend][0]),
+                                  {'match': self._match(), 'limit': limit, 'offset': offset}).all()
+        todos = {todo.id: todo for todo in Todo.query.filter(Todo.id.in_([row.id for row in rows]))}
+        return [(todos[row.id], row.rank) for row in rows if row.id in todos]
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self.backend == 'like':
+            return Todo.query.filter(self._like_filter()).count()
+        return db.session.execute(db.text(TODO_SEARCH_SQL[self.backend][1]), {'match': self._match()}).scalar()
+
+
+class TodoSearchPagination(Pagination):
+    """Пагинация Flask-SQLAlchemy поверх результатов TodoSearch"""
+
+    def _query_items(self):
+        return [todo for todo, _ in self._query_args['search'].results(self.per_page, self._query_offset)]
+
+    def _query_count(self):
+        return self._query_args['search'].count()
+
+
+def _make_etag(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+
+
+def _not_modified(etag, last_modified):
+    """Возвращает ответ 304, если валидаторы клиента совпадают с текущими"""
+    if request.if_none_match:
+        # Сжатый ответ несет слабый ETag (W/"..."), поэтому сравнение слабое
+        matched = request.if_none_match.contains_weak(etag)
+    elif request.if_modified_since and last_modified:
+        matched = last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    else:
+        matched = False
+    if not matched:
+        return None
+    response = Response(status=304)
+    _set_validators(response.headers, etag, last_modified)
+    return response
+
+
+def _set_validators(headers, etag, last_modified):
+    headers['ETag'] = f'"{etag}"'
+    if last_modified:
+        headers['Last-Modified'] = http_date(last_modified.replace(tzinfo=timezone.utc))
+    # Клиент может хранить ответ, но обязан перепроверять его при каждом запросе
+    headers['Cache-Control'] = 'private, no-cache'
+
+
+def conditional(probe=None):
+    """ETag / Last-Modified и ответы 304 для GET-методов Resource.
+
+    Без probe валидаторы считаются по уже сериализованному ответу (ресурс-элемент).
+    probe(resource, *args, **kwargs) -> (max_updated_at, count) вызывается до загрузки данных,
+    чтобы для коллекций ответить 304 по дешевому агрегатному запросу.
+    Декоратор ставится над marshal_with.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not current_user.is_authenticated:
+                return f(*args, **kwargs)
+            etag = last_modified = None
+            if probe is not None:
+                last_modified, count = probe(*args, **kwargs)
+                etag = collection_etag(last_modified, count)
+                not_modified = _not_modified(etag, last_modified)
+                if not_modified is not None:
+                    return not_modified
+            data, code, headers = unpack(f(*args, **kwargs))
+            if code != 200:
+                return data, code, headers
+            if probe is None:
+                etag, last_modified = item_validators(data)
+                not_modified = _not_modified(etag, last_modified)
+                if not_modified is not None:
+                    return not_modified
+            headers = dict(headers)
+            _set_validators(headers, etag, last_modified)
+            return data, code, headers
+        return wrapper
+    return decorator
+
+
+def collection_etag(last_modified, count):
+    """ETag коллекции по результату probe: зависит от параметров запроса и языка"""
+    return _make_etag(request.full_path, last_modified, count, get_locale())
+
+
+def item_validators(data):
+    """(ETag, Last-Modified) элемента по уже сериализованному ответу"""
+    etag = _make_etag(json.dumps(data, sort_keys=True, default=str))
+    updated_at = data.get('updated_at') if isinstance(data, dict) else None
+    return etag, datetime.fromisoformat(updated_at) if updated_at else None
+
+
+def probe_statement(model, query=None):
+    """SELECT max(updated_at), count() для коллекции — без загрузки строк"""
+    stmt = db.select(db.func.max(model.updated_at), db.func.count(model.id))
+    if query is not None:
+        stmt = query(stmt)
+    return stmt
+
+
+def probe_collection(model, query=None):
+    return db.session.execute(probe_statement(model, query)).one()
+
+
+# Кэш ответов API: данные после marshal_with, ключ — путь, пользователь и язык.
+# Ключ включает поколения затронутых таблиц; коммит, изменивший таблицу, увеличивает поколение,
+# и старые записи становятся недостижимыми (их вытесняет LRU или TTL)
+class LRUCacheBackend:
+    """Кэш в памяти процесса (LRU с TTL); поколения таблиц тоже локальны для процесса"""
+
+    def __init__(self, app):
+        self.maxsize = app.config['RESPONSE_CACHE_SIZE']
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._generations = {}
+
+    def generations(self, tags):
+        with self._lock:
+            entries = [self._generations.get(tag, (0, 0.0)) for tag in tags]
+        return tuple(generation for generation, _ in entries), max((bumped for _, bumped in entries), default=0.0)
+
+    def bump(self, tags):
+        now = time.time()
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = (self._generations.get(tag, (0, 0.0))[0] + 1, now)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+
+
+class SQLiteCacheBackend:
+    """Общий для всех процессов кэш в файле SQLite (RESPONSE_CACHE_PATH)"""
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS cache_entry (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)',
+        'CREATE TABLE IF NOT EXISTS cache_generation (tag TEXT PRIMARY KEY, generation INTEGER NOT NULL, '
+        'bumped_at REAL NOT NULL)',
+    )
+
+    def __init__(self, app):
+        self.path = app.config['RESPONSE_CACHE_PATH']
+        self.maxsize = app.config['RESPONSE_CACHE_SIZE']
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with self._connection() as connection:
+            for statement in self.SCHEMA:
+                connection.execute(statement)
+
+    def _connection(self):
+        # Соединение на поток; после fork — новое, соединение родителя не используется
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def generations(self, tags):
+        found = dict(((tag, (generation, bumped_at)) for tag, generation, bumped_at in self._connection().execute(
+            f"SELECT tag, generation, bumped_at FROM cache_generation WHERE tag IN ({','.join('?' * len(tags))})",
+            tags)))
+        entries = [found.get(tag, (0, 0.0)) for tag in tags]
+        return tuple(generation for generation, _ in entries), max((bumped for _, bumped in entries), default=0.0)
+
+    def bump(self, tags):
+        now = time.time()
+        self._connection().executemany(
+            'INSERT INTO cache_generation (tag, generation, bumped_at) VALUES (?, 1, ?) '
+            'ON CONFLICT (tag) DO UPDATE SET generation = generation + 1, bumped_at = excluded.bumped_at',
+            [(tag, now) for tag in tags])
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache_entry WHERE key = ? AND expires_at >= ?', (key, time.time())).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key, value, ttl):
+        connection = self._connection()
+        now = time.time()
+        connection.execute('INSERT OR REPLACE INTO cache_entry (key, value, expires_at) VALUES (?, ?, ?)',
+                           (key, json.dumps(value), now + ttl))
+        # Изредка убираем просроченные и недостижимые записи, ограничивая размер файла
+        if random.random() < 0.01:
+            connection.execute('DELETE FROM cache_entry WHERE expires_at < ?', (now,))
+            connection.execute('DELETE FROM cache_entry WHERE key NOT IN '
+                               '(SELECT key FROM cache_entry ORDER BY expires_at DESC LIMIT ?)', (self.maxsize,))
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute('DELETE FROM cache_entry')
+        connection.execute('DELETE FROM cache_generation')
+
+
+RESPONSE_CACHE_BACKENDS = {
+    'lru': LRUCacheBackend,
+    'sqlite': SQLiteCacheBackend,
+}
+
+
+class ResponseCache:
+    """Кэш сериализованных ответов GET-методов Resource с инвалидацией по коммиту"""
+
+    def __init__(self):
+        self.backend = None
+        self.ttl = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app):
+        name = app.config['RESPONSE_CACHE_BACKEND']
+        if name not in RESPONSE_CACHE_BACKENDS and name != 'none':
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {name!r}, "
+                             f"expected none or one of {', '.join(RESPONSE_CACHE_BACKENDS)}")
+        self.ttl = app.config['RESPONSE_CACHE_TTL']
+        self.backend = RESPONSE_CACHE_BACKENDS[name](app) if name != 'none' and self.ttl > 0 else None
+        app.extensions['response_cache'] = self
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def key(self, tags, generations):
+        return '|'.join([request.endpoint, request.full_path, current_user.get_id() or '-', str(get_locale()),
+                         *(f'{tag}:{generation}' for tag, generation in zip(tags, generations))])
+
+    def invalidate(self, tags):
+        if self.backend is not None and tags:
+            self.backend.bump(sorted(tags))
+
+    def generations(self, tags):
+        """Поколения таблиц (растут при каждом коммите, который их меняет); None без кэша ответов"""
+        if self.backend is None:
+            return None
+        return self.backend.generations(list(tags))[0]
+
+    def generation(self, tag):
+        generations = self.generations([tag])
+        return None if generations is None else generations[0]
+
+    def snapshot(self):
+        with self._lock:
+            return {'backend': type(self.backend).__name__ if self.backend else None,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+response_cache = app_extension('response_cache')
+
+
+def cached(*models):
+    """Кэширует ответ 200 GET-метода Resource до коммита, меняющего таблицы models.
+
+    Декоратор ставится над marshal_with и под conditional.
+    """
+    tags = sorted(model.__table__.name for model in models)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            backend = response_cache.backend
+            if backend is None or not current_user.is_authenticated:
+                return f(*args, **kwargs)
+            # Поколения читаются до загрузки данных: ответ, собранный до чужого коммита,
+            # сохранится под старым ключом и уже не будет выдан
+            generations, bumped_at = backend.generations(tags)
+            key = response_cache.key(tags, generations)
+            data = backend.get(key)
+            response_cache._count(data is not None)
+            if data is not None:
+                return data
+            data, code, headers = unpack(f(*args, **kwargs))
+            # Реплика могла еще не получить недавнюю запись: такой ответ не сохраняем
+            lagging = (g.get('db_route') == 'replica'
+                       and time.time() - bumped_at < current_app.config['DB_READ_YOUR_WRITES'])
+            if code == 200 and not headers and not lagging:
+                backend.set(key, data, response_cache.ttl)
+            return data, code, headers
+        return wrapper
+    return decorator
+
+
+def _cache_tags(session):
+    return session.info.setdefault('cache_tags', set())
+
 
-role_model = api.model('Role', {
-    'id': fields.Integer(readonly=True, description='The role unique identifier'),
-    'name': fields.String(required=True, description='The role name'),
-    'description': fields.String(description='The role description')
-})
+@event.listens_for(SASession, 'after_flush')
+def _collect_cache_tags(session, flush_context):
+    _cache_tags(session).update(obj.__table__.name for obj in (*session.new, *session.dirty, *session.deleted)
+                                if hasattr(obj, '__table__'))
 
-user_model = api.model('User', {
-    'id': fields.Integer(readonly=True, description='The user unique identifier'),
-    'username': fields.String(required=True, description='The username'),
-    'email': fields.String(required=True, description='The user email'),
-    'role_id': fields.Integer(required=True, description='The role ID'),
-    'role': fields.Nested(role_model, description='The user role'),
-    'created_at': fields.DateTime(readonly=True, description='Creation timestamp')
-})
 
-# Todo Model
-class Todo(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.Text)
-    completed = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    due_date = db.Column(db.DateTime, nullable=True)
+@event.listens_for(SASession, 'do_orm_execute')
+def _collect_dml_cache_tags(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and hasattr(table, 'name'):
+            _cache_tags(orm_execute_state.session).add(table.name)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'description': self.description,
-            'completed': self.completed,
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'due_date': self.due_date.isoformat() if self.due_date else None
-        }
 
-# Role Model
-class Role(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(50), unique=True, nullable=False)
-    description = db.Column(db.String(200))
+@event.listens_for(SASession, 'after_commit')
+def _invalidate_response_cache(session):
+    response_cache.invalidate(session.info.pop('cache_tags', None))
 
-    def __repr__(self):
-        return f'<Role {self.name}>'
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description
-        }
+@event.listens_for(SASession, 'after_rollback')
+def _discard_cache_tags(session):
+    session.info.pop('cache_tags', None)
 
-# User Model
-class User(UserMixin, db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    username = db.Column(db.String(64), unique=True, nullable=False)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128), nullable=False)
-    role_id = db.Column(db.Integer, db.ForeignKey('role.id'), nullable=False)
-    role = db.relationship('Role', backref=db.backref('users', lazy=True))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+def encode_todo_cursor(todo):
+    """Кодирует позицию (created_at, id) в непрозрачный курсор"""
+    raw = json.dumps([todo.created_at.isoformat(), todo.id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
 
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
 
-    def __repr__(self):
-        return f'<User {self.username}>'
+def decode_todo_cursor(cursor):
+    """Декодирует курсор обратно в (created_at, id); ValueError при неверном формате"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, todo_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(todo_id)
+    except (TypeError, ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f'Invalid cursor: {cursor}') from e
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'role_id': self.role_id,
-            'role': self.role.to_dict() if self.role else None,
-            'created_at': self.created_at.isoformat()
-        }
 
-# Options Model
-class Options(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    description = db.Column(db.Text)
-    user_id = db.Column(db.Integer, nullable=True)  # None for global options
-    category = db.Column(db.String(50))
-    value = db.Column(db.Text)
+def filter_todos(query, args):
+    """Применяет серверные фильтры completed / due_after / due_before"""
+    if args.get('completed') is not None:
+        query = query.filter(Todo.completed == args['completed'])
+    if args.get('due_after'):
+        query = query.filter(Todo.due_date >= args['due_after'])
+    if args.get('due_before'):
+        query = query.filter(Todo.due_date < args['due_before'])
+    return query
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'user_id': self.user_id,
-            'category': self.category,
-            'value': self.value
-        }
 
-# GeoGuessr Score Model
-class GeoGuessrScore(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    user = db.relationship('User', backref=db.backref('geoguessr_scores', lazy=True))
-    total_score = db.Column(db.Integer, nullable=False)
-    games_played = db.Column(db.Integer, default=1)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+def todo_page_statement(args):
+    """SELECT страницы задач после курсора; строк на одну больше limit, чтобы узнать о следующей"""
+    stmt = filter_todos(db.select(Todo), args)
+    if args['cursor']:
+        try:
+            created_at, todo_id = decode_todo_cursor(args['cursor'])
+        except ValueError:
+            ns.abort(400, 'Invalid cursor')
+        # Keyset: продолжаем строго после последней выданной строки, без OFFSET
+        stmt = stmt.where(db.or_(
+            Todo.created_at > created_at,
+            db.and_(Todo.created_at == created_at, Todo.id > todo_id)
+        ))
+    return stmt.order_by(Todo.created_at, Todo.id).limit(args['limit'] + 1)
+
+
+def todo_page(rows, limit):
+    items = rows[:limit]
+    return {
+        'items': [todo.to_dict() for todo in items],
+        'next_cursor': encode_todo_cursor(items[-1]) if len(rows) > limit else None,
+        'limit': limit
+    }
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'user': self.user.to_dict() if self.user else None,
-            'total_score': self.total_score,
-            'games_played': self.games_played,
-            'created_at': self.created_at.isoformat()
-        }
 
 # API Routes
 @ns.route('/')
 class TodoList(Resource):
     @ns.doc('list_todos')
-    @ns.marshal_list_with(todo_model)
+    @ns.expect(todo_list_parser)
+    @conditional(probe=lambda resource: probe_collection(Todo, lambda stmt: filter_todos(stmt, todo_list_parser.parse_args())))
+    @ns.marshal_with(todo_page_model)
     def get(self):
-        """List all todos"""
+        """List todos page by page using a cursor ordered by (created_at, id)"""
         if not current_user.is_authenticated:
             return {'message': 'Authentication required'}, 401
-        return [todo.to_dict() for todo in Todo.query.all()]
+        args = todo_list_parser.parse_args()
+        rows = db.session.scalars(todo_page_statement(args)).all()
+        return todo_page(rows, args['limit'])
 
     @ns.doc('create_todo')
     @ns.expect(todo_model)
@@ -297,13 +2791,231 @@ class TodoList(Resource):
         )
         db.session.add(new_todo)
         db.session.commit()
+        todo_stats.record_change(None, TodoStats.snapshot(new_todo))
         return new_todo.to_dict(), 201
 
+def iter_todo_rows(args):
+    """Читает задачи серверным курсором пачками по TODO_EXPORT_BATCH_SIZE строк"""
+    columns = [getattr(Todo, name) for name in TODO_EXPORT_COLUMNS]
+    stmt = filter_todos(db.select(*columns), args).order_by(Todo.id)
+    result = db.session.execute(stmt.execution_options(stream_results=True, yield_per=TODO_EXPORT_BATCH_SIZE))
+    try:
+        for batch in result.partitions():
+            yield batch
+    finally:
+        result.close()
+
+
+def _export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def generate_todo_ndjson(args):
+    for batch in iter_todo_rows(args):
+        yield ''.join(
+            json.dumps({name: _export_value(value) for name, value in zip(TODO_EXPORT_COLUMNS, row)},
+                       ensure_ascii=False) + '\n'
+            for row in batch
+        )
+
+
+def generate_todo_csv(args):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(TODO_EXPORT_COLUMNS)
+    for batch in iter_todo_rows(args):
+        writer.writerows([_export_value(value) for value in row] for row in batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Заголовок для пустой выборки
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def _parse_batch_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return inputs.datetime_from_iso8601(value)
+
+
+def validate_todo_batch(operations):
+    """Проверяет операции пакета; возвращает (результаты, текущие строки, есть_ли_ошибки)"""
+    results = []
+    target_ids = [op.get('id') for op in operations
+                  if isinstance(op, dict) and op.get('op') in ('update', 'delete')]
+    existing = {
+        row.id: row for row in db.session.execute(
+            db.select(Todo.id, Todo.completed, Todo.due_date).where(Todo.id.in_(
+                [todo_id for todo_id in target_ids if isinstance(todo_id, int)]
+            ))
+        )
+    } if target_ids else {}
+    seen_ids = set()
+    has_errors = False
+    for index, op in enumerate(operations):
+        kind = op.get('op') if isinstance(op, dict) else None
+        result = {'index': index, 'op': kind, 'id': None, 'status': 200, 'error': None}
+        try:
+            if kind not in ('create', 'update', 'delete'):
+                raise ValueError('op must be one of create, update, delete')
+            if kind != 'create':
+                todo_id = op.get('id')
+                if not isinstance(todo_id, int) or isinstance(todo_id, bool):
+                    raise ValueError('id must be an integer')
+                result['id'] = todo_id
+            data = op.get('data') or {}
+            if not isinstance(data, dict):
+                raise ValueError('data must be an object')
+            if 'due_date' in data:
+                data['due_date'] = _parse_batch_datetime(data['due_date'])
+            # bool("false") == True: строки и числа вместо true/false не принимаются
+            if 'completed' in data and not isinstance(data['completed'], bool):
+                raise ValueError('completed must be a boolean')
+            if 'title' in data and not isinstance(data['title'], str):
+                raise ValueError('title must be a string')
+            if data.get('description') is not None and not isinstance(data['description'], str):
+                raise ValueError('description must be a string')
+            if kind == 'create':
+                if not data.get('title'):
+                    raise ValueError('title is required')
+                result['status'] = 201
+            else:
+                if todo_id not in existing:
+                    result['status'] = 404
+                    raise ValueError('Todo not found')
+                if todo_id in seen_ids:
+                    raise ValueError('Todo id appears more than once in the batch')
+                seen_ids.add(todo_id)
+                if kind == 'delete':
+                    result['status'] = 204
+            op['data'] = data
+        except ValueError as e:
+            has_errors = True
+            if result['status'] < 400:
+                result['status'] = 400
+            result['error'] = str(e)
+        results.append(result)
+    return results, existing, has_errors
+
+
+def apply_todo_batch(operations, results, existing):
+    """Выполняет проверенный пакет массовыми INSERT/UPDATE/DELETE в одной транзакции"""
+    now = datetime.utcnow()
+    creates, updates, delete_ids = [], [], []
+    for op, result in zip(operations, results):
+        data = op['data']
+        if op['op'] == 'create':
+            completed = bool(data.get('completed', False))
+            creates.append((result, {
+                'title': data['title'],
+                'description': data.get('description', ''),
+                'completed': completed,
+                'due_date': resolve_due_date(False, completed, data.get('due_date')),
+                'created_at': now,
+                'updated_at': now
+            }))
+        elif op['op'] == 'update':
+            current = existing[op['id']]
+            new_completed = bool(data.get('completed', current.completed))
+            values = {'id': op['id'], 'updated_at': now, 'completed': new_completed,
+                      'due_date': resolve_due_date(current.completed, new_completed,
+                                                   data.get('due_date', current.due_date))}
+            for name in ('title', 'description'):
+                if name in data:
+                    values[name] = data[name]
+            updates.append(values)
+        else:
+            delete_ids.append(op['id'])
+
+    try:
+        if creates:
+            new_ids = db.session.scalars(
+                db.insert(Todo).returning(Todo.id, sort_by_parameter_order=True),
+                [values for _, values in creates]
+            ).all()
+            for (result, _), new_id in zip(creates, new_ids):
+                result['id'] = new_id
+        if updates:
+            db.session.execute(db.update(Todo), updates)
+        if delete_ids:
+            db.session.execute(db.delete(Todo).where(Todo.id.in_(delete_ids)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    # Массовые операции не проходят через ORM-объекты — пересчитаем статистику целиком
+    todo_stats.invalidate()
+
+
+@ns.route('/batch')
+class TodoBatch(Resource):
+    @ns.doc('batch_todos')
+    @ns.expect(todo_batch_model)
+    @ns.response(400, 'Batch rejected, nothing was applied')
+    def post(self):
+        """Create, update and delete many todos in a single transaction"""
+        if not current_user.is_authenticated:
+            return {'message': 'Authentication required'}, 401
+        data = request.get_json(silent=True) or {}
+        operations = data.get('operations')
+        if not isinstance(operations, list) or not operations:
+            ns.abort(400, 'operations must be a non-empty list')
+        if len(operations) > TODO_BATCH_MAX_OPERATIONS:
+            ns.abort(400, f'At most {TODO_BATCH_MAX_OPERATIONS} operations per batch')
+        results, existing, has_errors = validate_todo_batch(operations)
+        if has_errors:
+            return ns.marshal({'committed': False, 'results': results}, todo_batch_response_model), 400
+        apply_todo_batch(operations, results, existing)
+        return ns.marshal({'committed': True, 'results': results}, todo_batch_response_model), 200
+
+
+@ns.route('/search')
+class TodoSearchResource(Resource):
+    @ns.doc('search_todos')
+    @ns.expect(todo_search_parser)
+    @ns.marshal_with(todo_search_model)
+    def get(self):
+        """Full-text search over todo title and description"""
+        if not current_user.is_authenticated:
+            return {'message': 'Authentication required'}, 401
+        args = todo_search_parser.parse_args()
+        search = TodoSearch(args['q'])
+        limit = args['limit']
+        hits = search.results(limit, (args['page'] - 1) * limit)
+        return {
+            'items': [dict(todo.to_dict(), rank=rank) for todo, rank in hits],
+            'total': search.count(),
+            'page': args['page'],
+            'limit': limit
+        }
+
+
+@ns.route('/export')
+class TodoExport(Resource):
+    @ns.doc('export_todos')
+    @ns.expect(todo_export_parser)
+    @ns.produces(['application/x-ndjson', 'text/csv'])
+    def get(self):
+        """Stream all todos as NDJSON or CSV with constant memory"""
+        if not current_user.is_authenticated:
+            return {'message': 'Authentication required'}, 401
+        args = todo_export_parser.parse_args()
+        if args['format'] == 'csv':
+            body, mimetype = generate_todo_csv(args), 'text/csv'
+        else:
+            body, mimetype = generate_todo_ndjson(args), 'application/x-ndjson'
+        filename = f"todos-{datetime.utcnow():%Y%m%d%H%M%S}.{args['format']}"
+        return Response(stream_with_context(body), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
 @ns.route('/<int:id>')
 @ns.response(404, 'Todo not found')
 @ns.param('id', 'The todo identifier')
 class TodoItem(Resource):
     @ns.doc('get_todo')
+    @conditional()
     @ns.marshal_with(todo_model)
     def get(self, id):
         """Fetch a todo given its identifier"""
@@ -320,22 +3032,16 @@ class TodoItem(Resource):
         if not current_user.is_authenticated:
             return {'message': 'Authentication required'}, 401
         todo = Todo.query.get_or_404(id)
+        before = TodoStats.snapshot(todo)
         data = request.get_json()
         todo.title = data.get('title', todo.title)
         todo.description = data.get('description', todo.description)
-        # Команда: добавь возможность чтобы при включения чекбокса выполнения элемента автоматичесики выставлялась текущая дата выполнения, и при выключении, то дата убиралась
         new_completed = data.get('completed', todo.completed)
         new_due_date = data.get('due_date', todo.due_date)
-
-        if new_completed and not todo.completed:  # Переход из незавершенного в завершенное
-            if not new_due_date:  # Если дата не была указана вручную
-                new_due_date = datetime.utcnow()  # Автоматически устанавливаем текущую дату
-        elif not new_completed and todo.completed:  # Переход из завершенного в незавершенное
-            new_due_date = None  # Убираем дату выполнения
-
+        todo.due_date = resolve_due_date(todo.completed, new_completed, new_due_date)
         todo.completed = new_completed
-        todo.due_date = new_due_date
         db.session.commit()
+        todo_stats.record_change(before, TodoStats.snapshot(todo))
         return todo.to_dict()
 
     @ns.doc('delete_todo')
@@ -345,14 +3051,18 @@ class TodoItem(Resource):
         if not current_user.is_authenticated:
             return {'message': 'Authentication required'}, 401
         todo = Todo.query.get_or_404(id)
+        before = TodoStats.snapshot(todo)
         db.session.delete(todo)
         db.session.commit()
+        todo_stats.record_change(before, None)
         return '', 204
     
     # Options API Routes
     @ns_options.route('/')
     class OptionsList(Resource):
         @ns_options.doc('list_options')
+        @conditional(probe=lambda resource: probe_collection(Options))
+        @cached(Options)
         @ns_options.marshal_list_with(option_model)
         def get(self):
             """List all options"""
@@ -384,6 +3094,7 @@ class TodoItem(Resource):
     @ns_options.param('id', 'The option identifier')
     class OptionsItem(Resource):
         @ns_options.doc('get_option')
+        @conditional()
         @ns_options.marshal_with(option_model)
         def get(self, id):
             """Fetch an option given its identifier"""
@@ -424,12 +3135,13 @@ class TodoItem(Resource):
     @ns_users.route('/')
     class UsersList(Resource):
         @ns_users.doc('list_users')
+        @cached(User, Role)
         @ns_users.marshal_list_with(user_model)
         def get(self):
             """List all users"""
             if not current_user.is_authenticated:
                 return {'message': 'Authentication required'}, 401
-            return [user.to_dict() for user in User.query.all()]
+            return [user.to_dict() for user in User.query.options(db.joinedload(User.role)).all()]
 
         @ns_users.doc('create_user')
         @ns_users.expect(user_model)
@@ -496,6 +3208,7 @@ class TodoItem(Resource):
     @ns_roles.route('/')
     class RolesList(Resource):
         @ns_roles.doc('list_roles')
+        @cached(Role)
         @ns_roles.marshal_list_with(role_model)
         def get(self):
             """List all roles"""
@@ -556,14 +3269,33 @@ class TodoItem(Resource):
             db.session.delete(role)
             db.session.commit()
             return '', 204
+
+
+@ns_metrics.route('/')
+class Metrics(Resource):
+    @ns_metrics.doc('get_metrics')
+    def get(self):
+        """Counters of the worker process that served the request: pool, replica routing, response cache"""
+        if not is_admin():
+            return {'message': 'Administrator rights required'}, 403
+        metrics = {'pid': os.getpid(), 'pool': pool_metrics()}
+        if current_app.config['DATABASE_REPLICA_URL']:
+            metrics['routing'] = replica_metrics.snapshot()
+        metrics['response_cache'] = response_cache.snapshot()
+        if score_ingestor.enabled:
+            metrics['score_ingest'] = score_ingestor.snapshot()
+        catalog = current_location_catalog()
+        if catalog is not None:
+            metrics['location_catalog'] = catalog.snapshot()
+        return metrics
     
     # Language and theme switching
-@app.route('/language/<lang>')
+@web_bp.route('/language/<lang>')
 def set_language(lang):
-    if lang in app.config['BABEL_SUPPORTED_LOCALES']:
+    if lang in current_app.config['BABEL_SUPPORTED_LOCALES']:
         session['language'] = lang
     else:
-        logger.warning(f"Invalid language requested: {lang}")
+        logger.warning("Invalid language requested: %s", lang)
     
     # Очистка кэша локали для обеспечения обновления
     from flask import g
@@ -578,45 +3310,45 @@ def set_language(lang):
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return {'status': 'success', 'language': lang}
     
-    return redirect(request.referrer or url_for('index'))
+    return redirect(request.referrer or url_for('web.index'))
 
-@app.route('/theme/<theme>')
+@web_bp.route('/theme/<theme>')
 def set_theme(theme):
     if theme in ['light', 'dark']:
         session['theme'] = theme
-    return redirect(request.referrer or url_for('index'))
+    return redirect(request.referrer or url_for('web.index'))
 
-@app.route('/pagination/<int:per_page>')
+@web_bp.route('/pagination/<int:per_page>')
 def set_pagination(per_page):
     if per_page in [5, 10, 25, 50, 100]:
         session['per_page'] = per_page
-    return redirect(request.referrer or url_for('index'))
+    return redirect(request.referrer or url_for('web.index'))
 
-@app.route('/options')
+@web_bp.route('/options')
 @login_required
 def view_options():
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     # Получаем все опции пользователя
     user_options = Options.query.filter_by(user_id=None, category='user_settings').all()
     return render_template('options.html', options=user_options)
 
-@app.route('/admin/users')
+@web_bp.route('/admin/users')
 @login_required
 def manage_users():
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
-    users = User.query.all()
+        return redirect(url_for('web.index'))
+    users = User.query.options(db.joinedload(User.role)).all()
     return render_template('manage_users.html', users=users)
 
-@app.route('/admin/users/new', methods=['GET', 'POST'])
+@web_bp.route('/admin/users/new', methods=['GET', 'POST'])
 @login_required
 def new_user():
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     if request.method == 'POST':
         username = request.form.get('username')
         email = request.form.get('email')
@@ -625,10 +3357,10 @@ def new_user():
 
         if User.query.filter_by(username=username).first():
             flash(_('User with this username already exists'))
-            return redirect(url_for('new_user'))
+            return redirect(url_for('web.new_user'))
         if User.query.filter_by(email=email).first():
             flash(_('User with this email already exists'))
-            return redirect(url_for('new_user'))
+            return redirect(url_for('web.new_user'))
 
         role = Role.query.get_or_404(role_id)
         user = User(username=username, email=email, role=role)
@@ -636,16 +3368,16 @@ def new_user():
         db.session.add(user)
         db.session.commit()
         flash(_('User created successfully!'))
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('web.manage_users'))
     roles = Role.query.all()
     return render_template('user_form.html', roles=roles)
 
-@app.route('/admin/users/<int:id>/edit', methods=['GET', 'POST'])
+@web_bp.route('/admin/users/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_user(id):
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     user = User.query.get_or_404(id)
     if request.method == 'POST':
         user.username = request.form.get('username')
@@ -655,71 +3387,72 @@ def edit_user(id):
 
         if User.query.filter_by(username=user.username).first() and User.query.filter_by(username=user.username).first().id != id:
             flash(_('User with this username already exists'))
-            return redirect(url_for('edit_user', id=id))
+            return redirect(url_for('web.edit_user', id=id))
         if User.query.filter_by(email=user.email).first() and User.query.filter_by(email=user.email).first().id != id:
             flash(_('User with this email already exists'))
-            return redirect(url_for('edit_user', id=id))
+            return redirect(url_for('web.edit_user', id=id))
 
         user.role = Role.query.get_or_404(role_id)
         if password:
             user.set_password(password)
         db.session.commit()
         flash(_('User updated successfully!'))
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('web.manage_users'))
     roles = Role.query.all()
     return render_template('user_form.html', user=user, roles=roles)
 
-@app.route('/admin/users/<int:id>/delete')
+@web_bp.route('/admin/users/<int:id>/delete')
 @login_required
+@primary_only
 def delete_user(id):
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     user = User.query.get_or_404(id)
     if user.id == current_user.id:
         flash(_("Can't delete yourself!"))
-        return redirect(url_for('manage_users'))
+        return redirect(url_for('web.manage_users'))
     db.session.delete(user)
     db.session.commit()
     flash(_('User deleted successfully!'))
-    return redirect(url_for('manage_users'))
+    return redirect(url_for('web.manage_users'))
 
-@app.route('/admin/roles')
+@web_bp.route('/admin/roles')
 @login_required
 def manage_roles():
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     roles = Role.query.all()
     return render_template('manage_roles.html', roles=roles)
 
-@app.route('/admin/roles/new', methods=['GET', 'POST'])
+@web_bp.route('/admin/roles/new', methods=['GET', 'POST'])
 @login_required
 def new_role():
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     if request.method == 'POST':
         name = request.form.get('name')
         description = request.form.get('description')
 
         if Role.query.filter_by(name=name).first():
             flash(_('Role with this name already exists'))
-            return redirect(url_for('new_role'))
+            return redirect(url_for('web.new_role'))
 
         role = Role(name=name, description=description)
         db.session.add(role)
         db.session.commit()
         flash(_('Role created successfully!'))
-        return redirect(url_for('manage_roles'))
+        return redirect(url_for('web.manage_roles'))
     return render_template('role_form.html')
 
-@app.route('/admin/roles/<int:id>/edit', methods=['GET', 'POST'])
+@web_bp.route('/admin/roles/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_role(id):
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     role = Role.query.get_or_404(id)
     if request.method == 'POST':
         name = request.form.get('name')
@@ -727,58 +3460,63 @@ def edit_role(id):
 
         if Role.query.filter_by(name=name).first() and Role.query.filter_by(name=name).first().id != id:
             flash(_('Role with this name already exists'))
-            return redirect(url_for('edit_role', id=id))
+            return redirect(url_for('web.edit_role', id=id))
 
         role.name = name
         role.description = description
         db.session.commit()
         flash(_('Role updated successfully!'))
-        return redirect(url_for('manage_roles'))
+        return redirect(url_for('web.manage_roles'))
     return render_template('role_form.html', role=role)
 
-@app.route('/admin/roles/<int:id>/delete')
+@web_bp.route('/admin/roles/<int:id>/delete')
 @login_required
+@primary_only
 def delete_role(id):
     if not is_admin():
         flash(_('Access denied. Administrator rights required.'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     role = Role.query.get_or_404(id)
     if role.name == 'admin':
         flash(_("Can't delete admin role!"))
-        return redirect(url_for('manage_roles'))
+        return redirect(url_for('web.manage_roles'))
     if User.query.filter_by(role_id=id).first():
         flash(_("Can't delete role that is assigned to users!"))
-        return redirect(url_for('manage_roles'))
+        return redirect(url_for('web.manage_roles'))
     db.session.delete(role)
     db.session.commit()
     flash(_('Role deleted successfully!'))
-    return redirect(url_for('manage_roles'))
+    return redirect(url_for('web.manage_roles'))
 
 # Web Routes
-@app.route('/')
+@web_bp.route('/')
 def api_docs():
     # Перенаправление на Swagger UI
     return redirect('/swaggerui')
 
-@app.route('/login', methods=['GET', 'POST'])
+@web_bp.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
         if user and user.check_password(password):
+            # Прозрачно обновляем хеш, если изменились алгоритм или стоимость
+            if password_hasher.needs_rehash(user.password_hash):
+                user.set_password(password)
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
-            return redirect(next_page) if next_page else redirect(url_for('index'))
+            return redirect(next_page) if next_page else redirect(url_for('web.index'))
         flash(_('Invalid username or password'))
     return render_template('login.html')
 
-@app.route('/register', methods=['GET', 'POST'])
+@web_bp.route('/register', methods=['GET', 'POST'])
 def register():
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     if request.method == 'POST':
         username = request.form.get('username')
         email = request.form.get('email')
@@ -788,10 +3526,10 @@ def register():
         # Проверяем, существует ли пользователь
         if User.query.filter_by(username=username).first():
             flash(_('User with this username already exists'))
-            return redirect(url_for('register'))
+            return redirect(url_for('web.register'))
         if User.query.filter_by(email=email).first():
             flash(_('User with this email already exists'))
-            return redirect(url_for('register'))
+            return redirect(url_for('web.register'))
 
         # Получаем роль
         role = Role.query.filter_by(name=role_name).first()
@@ -808,16 +3546,16 @@ def register():
         db.session.commit()
 
         flash(_('Registration successful! You can now log in.'))
-        return redirect(url_for('login'))
+        return redirect(url_for('web.login'))
     return render_template('register.html')
 
-@app.route('/logout')
+@web_bp.route('/logout')
 @login_required
 def logout():
     logout_user()
-    return redirect(url_for('login'))
+    return redirect(url_for('web.login'))
 
-@app.route('/dashboard')
+@web_bp.route('/dashboard')
 @login_required
 def index():
     # Параметры пагинации
@@ -834,13 +3572,21 @@ def index():
     if per_page not in [5, 10, 25, 50, 100]:
         per_page = 10
 
-    # Получение данных с пагинацией
-    pagination = Todo.query.paginate(page=page, per_page=per_page, error_out=False)
+    # Статистика по всей таблице из кэша; общее число строк берем оттуда же вместо COUNT(*)
+    stats = todo_stats.get()
+    search_query = request.args.get('q', '').strip()
+    if search_query:
+        pagination = TodoSearchPagination(page=page, per_page=per_page, error_out=False,
+                                          search=TodoSearch(search_query))
+    else:
+        pagination = Todo.query.paginate(page=page, per_page=per_page, error_out=False, count=False)
+        pagination.total = stats['total']
     todos = pagination.items
 
-    return render_template('index.html', todos=todos, pagination=pagination, per_page=per_page)
+    return render_template('index.html', todos=todos, pagination=pagination, per_page=per_page, stats=stats,
+                           search_query=search_query)
 
-@app.route('/todo/new', methods=['GET', 'POST'])
+@web_bp.route('/todo/new', methods=['GET', 'POST'])
 @login_required
 def new_todo():
     if request.method == 'POST':
@@ -855,15 +3601,17 @@ def new_todo():
         new_todo = Todo(title=title, description=description, due_date=due_date, completed=completed)
         db.session.add(new_todo)
         db.session.commit()
+        todo_stats.record_change(None, TodoStats.snapshot(new_todo))
         flash(_('Todo created successfully!'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     return render_template('todo_form.html')
 
-@app.route('/todo/<int:id>/edit', methods=['GET', 'POST'])
+@web_bp.route('/todo/<int:id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_todo(id):
     todo = Todo.query.get_or_404(id)
     if request.method == 'POST':
+        before = TodoStats.snapshot(todo)
         todo.title = request.form['title']
         todo.description = request.form.get('description', '')
         # Команда: добавь возможность чтобы при включения чекбокса выполнения элемента автоматичесики выставлялась текущая дата выполнения, и при выключении, то дата убиралась
@@ -880,23 +3628,29 @@ def edit_todo(id):
         todo.completed = new_completed
         todo.due_date = new_due_date
         db.session.commit()
+        todo_stats.record_change(before, TodoStats.snapshot(todo))
         flash(_('Todo updated successfully!'))
-        return redirect(url_for('index'))
+        return redirect(url_for('web.index'))
     return render_template('todo_form.html', todo=todo)
 
-@app.route('/todo/<int:id>/delete')
+@web_bp.route('/todo/<int:id>/delete')
 @login_required
+@primary_only
 def delete_todo(id):
     todo = Todo.query.get_or_404(id)
+    before = TodoStats.snapshot(todo)
     db.session.delete(todo)
     db.session.commit()
+    todo_stats.record_change(before, None)
     flash(_('Todo deleted successfully!'))
-    return redirect(url_for('index'))
+    return redirect(url_for('web.index'))
 
-@app.route('/todo/<int:id>/toggle')
+@web_bp.route('/todo/<int:id>/toggle')
 @login_required
+@primary_only
 def toggle_todo(id):
     todo = Todo.query.get_or_404(id)
+    before = TodoStats.snapshot(todo)
     # Команда: добавь возможность чтобы при включения чекбокса выполнения элемента автоматичесики выставлялась текущая дата выполнения, и при выключении, то дата убиралась
     was_completed = todo.completed
     todo.completed = not was_completed
@@ -906,67 +3660,585 @@ def toggle_todo(id):
     elif not todo.completed and was_completed:  # Стало незавершенным
         todo.due_date = None  # Убираем дату выполнения
     db.session.commit()
-    return redirect(url_for('index'))
+    todo_stats.record_change(before, TodoStats.snapshot(todo))
+    return redirect(url_for('web.index'))
 
 # GeoGuessr Routes
-@app.route('/geoguessr')
+@geoguessr_bp.route('/geoguessr')
+@login_required
 def geoguessr_game():
     return render_template('geoguessr_game.html')
 
-@app.route('/geoguessr/leaderboard')
+@geoguessr_bp.route('/geoguessr/leaderboard')
 def geoguessr_leaderboard():
-    # Получаем топ-100 результатов
-    scores = GeoGuessrScore.query.order_by(GeoGuessrScore.total_score.desc()).limit(100).all()
+    # Получаем топ-100 результатов вместе с пользователями одним запросом
+    scores = (GeoGuessrScore.query
+              .options(db.joinedload(GeoGuessrScore.user))
+              .order_by(GeoGuessrScore.total_score.desc())
+              .limit(100).all())
     
-    # Статистика текущего пользователя
+    # Статистика текущего пользователя из предрассчитанной сводки
     user_stats = None
     if current_user.is_authenticated:
-        user_scores = GeoGuessrScore.query.filter_by(user_id=current_user.id).all()
-        if user_scores:
-            total_games = len(user_scores)
-            total_score = sum(s.total_score for s in user_scores)
-            best_score = max(s.total_score for s in user_scores)
-            avg_score = total_score / total_games if total_games > 0 else 0
-            
-            # Определяем ранг пользователя
-            all_best_scores = db.session.query(
-                GeoGuessrScore.user_id,
-                db.func.max(GeoGuessrScore.total_score).label('best')
-            ).group_by(GeoGuessrScore.user_id).order_by(db.text('best DESC')).all()
-            
-            rank = 1
-            for idx, (uid, score) in enumerate(all_best_scores, 1):
-                if uid == current_user.id:
-                    rank = idx
-                    break
-            
+        summary = db.session.get(GeoGuessrUserStats, current_user.id)
+        if summary and summary.games_played:
             user_stats = {
-                'games_played': total_games,
-                'best_score': best_score,
-                'avg_score': avg_score,
-                'rank': rank
+                'games_played': summary.games_played,
+                'best_score': summary.best_score,
+                'avg_score': summary.avg_score,
+                'rank': summary.rank()
             }
     
     return render_template('geoguessr_leaderboard.html', scores=scores, user_stats=user_stats)
 
-@app.route('/geoguessr/save_score', methods=['POST'])
+@geoguessr_bp.route('/geoguessr/round_set')
+@login_required
+def geoguessr_round_set():
+    """Подписанный токен следующей игры (номера локаций) для reveal_round и save_score.
+
+    Необязательные параметры (нужен каталог локаций): region, difficulty, near=lat,lng и radius_km.
+    """
+    try:
+        difficulty = request.args.get('difficulty', type=int)
+        near = request.args.get('near')
+        if near is not None:
+            near = tuple(float(value) for value in near.split(','))
+            if len(near) != 2 or not (-90 <= near[0] <= 90 and -180 <= near[1] <= 180):
+                raise ValueError
+        radius_km = request.args.get('radius_km', 500.0, type=float)
+    except ValueError:
+        return {'status': 'error', 'message': 'near must be "lat,lng"'}, 400
+    # Недавно сыгранные локации сессии пропускаются: [id каталога, [номера записей]]
+    catalog_id, recent = session.get('geoguessr_recent') or (None, [])
+    catalog = current_location_catalog()
+    if catalog is None or catalog_id != catalog.id:
+        recent = []
+    try:
+        picked_catalog, picked = pick_round_locations(request.args.get('region'), difficulty, near, radius_km, recent)
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}, 400
+    if picked_catalog is not None:
+        session['geoguessr_recent'] = [catalog.id, (recent + picked)[-current_app.config['GEOGUESSR_RECENT_LOCATIONS']:]]
+    return issue_round_set(current_user.id, picked_catalog, picked)
+
+@geoguessr_bp.route('/geoguessr/round_set/reveal', methods=['POST'])
+@login_required
+def geoguessr_reveal_round():
+    """Координаты одного раунда для Street View: {"token": "...", "round": 1..5}"""
+    data = request.get_json(silent=True) or {}
+    try:
+        lat, lng = reveal_round(load_round_set(data.get('token'), current_user.id), data.get('round'))
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}, 400
+    return {'round': data['round'], 'lat': lat, 'lng': lng}
+
+@geoguessr_bp.route('/geoguessr/save_score', methods=['POST'])
 @login_required
 def save_geoguessr_score():
-    data = request.get_json()
-    total_score = data.get('total_score', 0)
-    
+    # Клиент присылает только токен набора раундов и догадки; очки считает сервер
+    data = request.get_json(silent=True) or {}
+    submitted_at = time.time()
+    try:
+        round_set, locations, guesses = parse_round_submission(data, current_user.id)
+    except ValueError as e:
+        return {'status': 'error', 'message': str(e)}, 400
+    round_id = round_set['id']
+
+    distances, scores, totals = score_games([locations], [guesses])
+    # Мгновенные раунды и догадки точно в ответ не попадают ни в очередь, ни в таблицу лидеров
+    try:
+        check_round_timing(round_set, submitted_at)
+        check_round_distances(distances[0])
+    except ValueError as e:
+        logger.warning('Rejected GeoGuessr game %s of user %s: %s', round_id, current_user.id, e)
+        return {'status': 'error', 'message': f'Implausible game: {e}'}, 422
+    session.pop('geoguessr_reveals', None)
+
+    if score_ingestor.enabled:
+        ingest_id = score_ingestor.submit(current_user.id, round_id, locations, guesses)
+        if ingest_id is not None:
+            # Результат попадет в таблицу и таблицу лидеров с задержкой до SCORE_BATCH_INTERVAL
+            return {'status': 'accepted', 'ingest_id': ingest_id}, 202
+
+    total_score = int(totals[0])
     # Сохраняем результат
     score = GeoGuessrScore(
         user_id=current_user.id,
         total_score=total_score,
-        games_played=1
+        games_played=1,
+        round_id=round_id
     )
-    db.session.add(score)
-    db.session.commit()
-    
-    return {'status': 'success', 'score_id': score.id}
+    try:
+        db.session.add(score)
+        GeoGuessrUserStats.record_score(current_user.id, total_score)
+        db.session.commit()
+    except sa_exc.IntegrityError:
+        db.session.rollback()
+        return {'status': 'error', 'message': 'Round set has already been submitted'}, 409
+
+    return {
+        'status': 'success',
+        'score_id': score.id,
+        'total_score': total_score,
+        'rounds': [{'round': number, 'distance': round(float(distance), 1), 'score': int(points)}
+                   for number, (distance, points) in enumerate(zip(distances[0], scores[0]), 1)],
+    }
+
+# Предкомпиляция шаблонов и переводов: flask precompile-templates
+@click.command('precompile-templates')
+@with_appcontext
+def precompile_templates():
+    """Компилирует все шаблоны в байткод (JINJA_CACHE_DIR) и каталоги переводов в .mo"""
+    if current_app.jinja_env.bytecode_cache is None:
+        raise click.ClickException('JINJA_CACHE_DIR не задан, байткод сохранять некуда')
+    started = time.perf_counter()
+    names = current_app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html'))
+    failed = 0
+    for name in names:
+        try:
+            current_app.jinja_env.get_template(name)
+        except TemplateError as e:
+            failed += 1
+            click.echo(f"Ошибка в шаблоне {name}: {e}", err=True)
+    locales = []
+    for directory in current_app.config.get('BABEL_TRANSLATION_DIRECTORIES', 'translations').split(';'):
+        directory = os.path.join(current_app.root_path, directory)
+        if os.path.isdir(directory):
+            locales += compile_catalogs(directory)
+    click.echo(f"Шаблонов: {len(names) - failed}, локалей: {', '.join(locales)}, "
+               f"{time.perf_counter() - started:.2f} с; кэш: {current_app.config['JINJA_CACHE_DIR']}")
+    if failed:
+        raise SystemExit(1)
+
+# Массовая загрузка данных: flask bulk-load todos|users|scores
+def _parse_bool(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y', 't')
+
+
+def _parse_datetime(value):
+    if value in (None, '') or isinstance(value, datetime):
+        return value or None
+    return datetime.fromisoformat(str(value))
+
+
+class InputRow(dict):
+    """Строка входного файла вместе с номером строки в файле — для сообщений об ошибках"""
+
+    def __init__(self, data, line):
+        super().__init__(data)
+        self.line = line
+
+
+def _field(raw, name, parse=None, required=False):
+    """Значение поля строки; ValueError с именем поля, если оно отсутствует или не разбирается"""
+    value = raw.get(name)
+    if value in (None, ''):
+        if required:
+            raise ValueError(f'missing field {name!r}')
+        return None
+    if parse is None:
+        return value
+    try:
+        return parse(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'invalid {name!r}: {value!r}')
+
+
+def _prepare_rows(raw_rows, convert):
+    """Применяет convert к каждой строке; ошибка строки — ClickException с номером строки файла"""
+    rows = []
+    for raw in raw_rows:
+        try:
+            rows.append(convert(raw))
+        except ValueError as e:
+            line = getattr(raw, 'line', None)
+            raise click.ClickException(f'Line {line}: {e}' if line else str(e))
+    return rows
 
-if __name__ == '__main__':
+
+def _prepare_todos(raw_rows, options):
+    now = datetime.utcnow()
+
+    def convert(raw):
+        created_at = _field(raw, 'created_at', _parse_datetime) or now
+        return {
+            'title': _field(raw, 'title', required=True),
+            'description': raw.get('description') or None,
+            'completed': bool(_field(raw, 'completed', _parse_bool)),
+            'due_date': _field(raw, 'due_date', _parse_datetime),
+            'created_at': created_at,
+            'updated_at': _field(raw, 'updated_at', _parse_datetime) or created_at,
+        }
+    return _prepare_rows(raw_rows, convert)
+
+
+def _prepare_users(raw_rows, options):
+    now = datetime.utcnow()
+    roles = options.setdefault('roles', {role.name: role.id for role in Role.query.all()})
+    to_hash = [raw.get('password') or '' for raw in raw_rows if not raw.get('password_hash')]
+    hashes = iter(password_hasher.hash_many(to_hash, options.get('password_method')))
+
+    def convert(raw):
+        password_hash = raw.get('password_hash') or next(hashes)
+        role_id = _field(raw, 'role_id', int) or roles.get(raw.get('role') or 'user')
+        if role_id is None:
+            raise ValueError(f"unknown role {raw.get('role')!r} for user {raw.get('username')!r}")
+        return {
+            'username': _field(raw, 'username', required=True),
+            'email': _field(raw, 'email', required=True),
+            'password_hash': password_hash,
+            'role_id': role_id,
+            'created_at': _field(raw, 'created_at', _parse_datetime) or now,
+        }
+    return _prepare_rows(raw_rows, convert)
+
+
+def _prepare_scores(raw_rows, options):
+    now = datetime.utcnow()
+    usernames = {raw['username'] for raw in raw_rows if not raw.get('user_id') and raw.get('username')}
+    user_ids = dict(db.session.execute(
+        db.select(User.username, User.id).where(User.username.in_(usernames))
+    ).all()) if usernames else {}
+
+    def convert(raw):
+        user_id = _field(raw, 'user_id', int) or user_ids.get(raw.get('username'))
+        if user_id is None:
+            raise ValueError(f"unknown user {raw.get('username')!r}")
+        return {
+            'user_id': user_id,
+            'total_score': _field(raw, 'total_score', int, required=True),
+            'games_played': _field(raw, 'games_played', int) or 1,
+            'created_at': _field(raw, 'created_at', _parse_datetime) or now,
+        }
+    return _prepare_rows(raw_rows, convert)
+
+
+BULK_LOAD_KINDS = {
+    'todos': (Todo, _prepare_todos),
+    'users': (User, _prepare_users),
+    'scores': (GeoGuessrScore, _prepare_scores),
+}
+
+
+def synthetic_rows(kind, start, count):
+    """Синтетические строки в формате входного файла; start задает сквозную нумерацию"""
+    now = datetime.utcnow()
+    if kind == 'scores':
+        user_ids = db.session.scalars(db.select(User.id)).all()
+        if not user_ids:
+            raise click.ClickException('Load users before scores')
+    for i in range(start, start + count):
+        if kind == 'todos':
+            created_at = now - timedelta(seconds=start + count - i)
+            completed = i % 3 == 0
+            yield {
+                'title': f'Задача {i}',
+                'description': f'Описание синтетической задачи номер {i}',
+                'completed': completed,
+                'created_at': created_at,
+                'due_date': created_at + timedelta(days=i % 30 - 10) if completed or i % 2 else None,
+            }
+        elif kind == 'users':
+            yield {'username': f'user_{i}', 'email': f'user_{i}@example.com', 'password': f'password_{i}'}
+        else:
+            yield {'user_id': random.choice(user_ids), 'total_score': random.randint(0, 25000), 'created_at': now}
+
+
+def read_input_rows(stream, fmt):
+    """Строки CSV/NDJSON как InputRow с номером строки файла"""
+    if fmt == 'ndjson':
+        for number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise click.ClickException(f'Line {number}: invalid JSON: {e}')
+            if not isinstance(row, dict):
+                raise click.ClickException(f'Line {number}: expected a JSON object')
+            yield InputRow(row, number)
+    else:
+        reader = csv.DictReader(stream)
+        for row in reader:
+            # line_num — последняя прочитанная строка файла (поле в кавычках может занимать несколько)
+            yield InputRow(row, reader.line_num)
+
+
+def _copy_rows(model, rows):
+    """COPY ... FROM STDIN для PostgreSQL (psycopg2)"""
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(['\\N' if row[column] is None else row[column] for column in columns])
+    buffer.seek(0)
+    table = model.__table__.name
+    column_list = ', '.join(f'"{column}"' for column in columns)
+    # COPY идет мимо ORM-событий: тег таблицы для сброса кэша ответов при коммите добавляем сами
+    _cache_tags(db.session).add(table)
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY "{table}" ({column_list}) FROM STDIN WITH (FORMAT csv, NULL \'\\N\')', buffer)
+    finally:
+        cursor.close()
+
+
+def bulk_load(kind, raw_rows, chunk_size=10000, options=None, progress=None):
+    """Загружает строки пачками (COPY на PostgreSQL, executemany на прочих СУБД)"""
+    model, prepare = BULK_LOAD_KINDS[kind]
+    options = {} if options is None else options
+    use_copy = db.session.get_bind().dialect.name == 'postgresql'
+    loaded = 0
+    started = time.perf_counter()
+    chunk = []
+
+    def flush(chunk):
+        rows = prepare(chunk, options)
+        if use_copy:
+            _copy_rows(model, rows)
+        else:
+            # Core INSERT по таблице — один executemany на пачку
+            db.session.execute(model.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+    for raw in raw_rows:
+        chunk.append(raw)
+        if len(chunk) >= chunk_size:
+            loaded += flush(chunk)
+            chunk = []
+            if progress:
+                progress(loaded, time.perf_counter() - started)
+    if chunk:
+        loaded += flush(chunk)
+        if progress:
+            progress(loaded, time.perf_counter() - started)
+    if kind == 'scores':
+        GeoGuessrUserStats.rebuild()
+    return loaded
+
+
+@click.command('bulk-load')
+@with_appcontext
+@click.argument('kind', type=click.Choice(sorted(BULK_LOAD_KINDS)))
+@click.option('--input', 'input_file', type=click.File('r', encoding='utf-8'),
+              help='CSV or NDJSON file to load, "-" for stdin')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format (default: from file extension, otherwise csv)')
+@click.option('--generate', type=int, help='Generate N synthetic rows instead of reading input')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per INSERT/COPY and commit')
+@click.option('--password-method', help='Werkzeug hash method for imported passwords, e.g. pbkdf2:sha256:1000 '
+                                        '(upgraded to PASSWORD_HASH_METHOD on next login)')
+def bulk_load_command(kind, input_file, fmt, generate, chunk_size, password_method):
+    """Bulk load todos, users or GeoGuessr scores from CSV/NDJSON or synthetic data."""
+    if (input_file is None) == (generate is None):
+        raise click.UsageError('Pass exactly one of --input or --generate')
+    if generate is not None:
+        model = BULK_LOAD_KINDS[kind][0]
+        start = db.session.scalar(db.select(db.func.count()).select_from(model))
+        raw_rows = synthetic_rows(kind, start, generate)
+    else:
+        if fmt is None:
+            fmt = 'ndjson' if input_file.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+        raw_rows = read_input_rows(input_file, fmt)
+
+    def progress(loaded, elapsed):
+        click.echo(f'{kind}: {loaded} rows, {loaded / elapsed if elapsed else 0:,.0f} rows/s', err=True)
+
+    loaded = bulk_load(kind, raw_rows, chunk_size, {'password_method': password_method}, progress)
+    click.echo(f'Loaded {loaded} {kind}')
+
+
+# Копия основной базы в реплику для локальной проверки: flask replica-sync
+@click.command('replica-sync')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per INSERT batch')
+@with_appcontext
+def replica_sync_command(chunk_size):
+    """Copy every table from the primary database to DATABASE_REPLICA_URL.
+
+    Stands in for real replication when testing read routing with two local
+    SQLite files or two local PostgreSQL databases.
+    """
+    if not current_app.config['DATABASE_REPLICA_URL']:
+        raise click.UsageError('DATABASE_REPLICA_URL is not set')
+    primary, replica = db.engines[None], db.engines['replica']
+    db.metadata.create_all(replica)
+    with primary.connect() as source, replica.begin() as target:
+        for table in reversed(db.metadata.sorted_tables):
+            target.execute(table.delete())
+        for table in db.metadata.sorted_tables:
+            copied = 0
+            result = source.execution_options(yield_per=chunk_size).execute(table.select())
+            for rows in result.mappings().partitions():
+                target.execute(table.insert(), [dict(row) for row in rows])
+                copied += len(rows)
+            click.echo(f'{table.name}: {copied} rows')
+
+
+# Каталог локаций GeoGuessr из CSV/NDJSON: flask build-location-catalog --input locations.csv
+def synthetic_locations(count):
+    """Случайные точки, равномерные по сфере; регион — сектор долготы, сложность 0..2"""
+    lats = np.degrees(np.arcsin(np.random.uniform(-1, 1, count)))
+    lngs = np.random.uniform(-180, 180, count)
+    for lat, lng in zip(lats.tolist(), lngs.tolist()):
+        yield {'lat': lat, 'lng': lng, 'region': f'sector-{int((lng + 180) // 45)}',
+               'difficulty': random.randrange(3)}
+
+
+@click.command('build-location-catalog')
+@with_appcontext
+@click.option('--input', 'input_file', type=click.File('r', encoding='utf-8'),
+              help='CSV or NDJSON file with lat, lng, region and optional difficulty, "-" for stdin')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+              help='Input format (default: from file extension, otherwise csv)')
+@click.option('--generate', type=int, help='Generate N random locations instead of reading input')
+@click.option('--output', help='Catalog file (default: GEOGUESSR_CATALOG_PATH)')
+@click.option('--grid-deg', default=1.0, show_default=True, type=click.FloatRange(0.01, 90),
+              help='Grid cell size in degrees for nearby and recent-location queries')
+def build_location_catalog_command(input_file, fmt, generate, output, grid_deg):
+    """Build the memory-mapped GeoGuessr location catalog.
+
+    Running workers pick up the new file on their next round set.
+    """
+    if (input_file is None) == (generate is None):
+        raise click.UsageError('Pass exactly one of --input or --generate')
+    if generate is not None:
+        rows = synthetic_locations(generate)
+    else:
+        if fmt is None:
+            fmt = 'ndjson' if input_file.name.endswith(('.ndjson', '.jsonl')) else 'csv'
+        rows = read_input_rows(input_file, fmt)
+    path = output or current_app.config['GEOGUESSR_CATALOG_PATH']
+    started = time.perf_counter()
+    try:
+        header = build_location_catalog(rows, path, grid_deg)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f"Wrote {header['count']} locations in {len(header['regions'])} regions to {path} "
+               f"({os.path.getsize(path):,} bytes, {time.perf_counter() - started:.1f} s)")
+
+
+# Фабрика приложения
+# Созданные приложения в порядке создания; обработчик fork регистрируется один раз на процесс,
+# а приложения, которые больше никто не держит (бенчмарк, проверки), выпадают сами
+_created_apps = weakref.WeakValueDictionary()
+_app_numbers = itertools.count()
+
+
+def _after_fork_in_child():
+    """Соединения пула и поток журнала родителя не переживают fork: пересоздаем их в дочернем процессе"""
+    global log_listener
+    apps = list(_created_apps.values())
+    for app in apps:
+        with app.app_context():
+            for engine in db.engines.values():
+                # close=False: сокеты принадлежат родителю, закрывать их из потомка нельзя
+                engine.dispose(close=False)
+                if getattr(engine.pool, 'metrics', None) is not None:
+                    engine.pool.metrics.reset()
+        app.extensions['replica_metrics'].reset()
+    if apps:
+        # Очередь родителя могла быть захвачена его потоком в момент fork, поэтому старый listener не трогаем.
+        # Журнал настроен по последнему созданному приложению — как и в create_app
+        log_listener = None
+        configure_logging(apps[-1].config)
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def create_app(config=None):
+    """Создает приложение: конфигурация, расширения, хуки, blueprints и CLI-команды"""
+    app = Flask(__name__)
+    configure_app(app)
+    if config:
+        app.config.update(config)
+    configure_logging(app.config)
+    CORS(app)
+    if app.config['JINJA_CACHE_DIR']:
+        os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+
+    profile = engine_profile(app.config)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {**ENGINE_PROFILES[profile](app.config),
+                                               **app.config['SQLALCHEMY_ENGINE_OPTIONS']}
+    if app.config['DATABASE_REPLICA_URL']:
+        # SQLALCHEMY_ENGINE_OPTIONS к дополнительным bind не применяются: профиль передается явно
+        replica_url = database_url(app.config['DATABASE_REPLICA_URL'])
+        replica_options = ENGINE_PROFILES[profile](dict(app.config, SQLALCHEMY_DATABASE_URI=replica_url))
+        app.config['SQLALCHEMY_BINDS'] = {'replica': {**replica_options, 'url': replica_url},
+                                          **app.config.get('SQLALCHEMY_BINDS', {})}
+    db.init_app(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            init_engine(engine, profile, app.config)
+    migrate.init_app(app, db)
+    login_manager.init_app(app)
+    babel.init_app(app, locale_selector=get_locale)
+    # Кэши, счетчики и фоновые потоки — свои у каждого приложения (app.extensions), а не общие на процесс
+    ReplicaRoutingMetrics().init_app(app)
+    IdentityCache().init_app(app)
+    ResponseCache().init_app(app)
+    ScoreIngestor().init_app(app)
+    PasswordHasher().init_app(app)
+    TodoStats().init_app(app)
+    init_assets(app)
+
+    # after_request выполняются в обратном порядке: сжатие регистрируется первым, чтобы сработать последним
+    app.before_request(load_user_settings)
+    app.after_request(compress_response)
+    app.before_request(start_sql_stats)
+    app.after_request(report_sql_stats)
+    app.before_request(start_db_route)
+    app.after_request(finish_db_route)
+    app.register_error_handler(PasswordHasherBusy, password_hasher_busy)
+
+    app.register_blueprint(api_bp)
+    app.register_blueprint(web_bp)
+    app.register_blueprint(geoguessr_bp)
+    app.cli.add_command(precompile_templates)
+    app.cli.add_command(bulk_load_command)
+    app.cli.add_command(replica_sync_command)
+    app.cli.add_command(build_location_catalog_command)
+
+    _created_apps[next(_app_numbers)] = app
+    return app
+
+
+def init_database(app):
+    """Создает недостающие таблицы и полнотекстовый индекс"""
     with app.app_context():
         db.create_all()
-    app.run(host='0.0.0.0', port=5000, debug=True)
+        create_todo_search_index()
+        db.engine.dispose()
+
+
+def warm_up(app):
+    """Прогрев рабочего процесса до приема запросов: мапперы ORM, шаблоны, переводы, пул соединений"""
+    started = time.perf_counter()
+    configure_mappers()
+    for name in app.jinja_env.list_templates(filter_func=lambda name: name.endswith('.html')):
+        app.jinja_env.get_template(name)
+    with app.test_request_context():
+        for locale in app.config['BABEL_SUPPORTED_LOCALES']:
+            with force_locale(locale):
+                get_translations()
+        connections = []
+        try:
+            for _ in range(app.config['WARMUP_DB_CONNECTIONS']):
+                connection = db.engine.connect()
+                connections.append(connection)
+                connection.execute(db.text('SELECT 1'))
+        finally:
+            # Соединения возвращаются в пул и остаются открытыми
+            for connection in connections:
+                connection.close()
+    # Поток записи результатов и проигрывание spool-файлов упавших процессов — до первого запроса
+    app.extensions['score_ingestor'].start()
+    # Отображение каталога локаций открывается заранее; сами страницы общие для всех процессов
+    with app.app_context():
+        current_location_catalog()
+    logger.info('Worker %d warmed up in %.1f ms', os.getpid(), (time.perf_counter() - started) * 1000)
+
@@ -0,0 +1,278 @@
+"""
+ASGI-режим для REST API:
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 4
+
+Соединения клиентов обслуживает цикл событий uvicorn, поэтому тысячи открытых keep-alive
+соединений не занимают потоки. GET-запросы к спискам и элементам api/todos, api/options,
+api/users и api/roles выполняются асинхронно: чтение из БД идет через асинхронный драйвер
+SQLAlchemy (aiosqlite / asyncpg) и не блокирует процесс; при заданном DATABASE_REPLICA_URL
+чтения идут на реплику по тем же правилам, что и в Flask-приложении. Разбор параметров, сериализация по
+моделям Swagger, ETag/304, сжатие и cookie сессии — те же функции, что и в Flask-приложении.
+Все остальные запросы (изменения, страницы, /api/docs, swagger.json) передаются в
+Flask-приложение, которое выполняется в пуле потоков.
+"""
+
+import asyncio
+import io
+
+from asgiref.wsgi import WsgiToAsgi
+from flask import Response, abort, g, session as flask_session
+from flask_restx import marshal
+from flask_restx.utils import unpack
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.engine import make_url
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+from app import (ENGINE_PROFILES, Options, Role, Todo, User, _apply_sqlite_pragmas, _not_modified,
+                 _set_validators, api, collection_etag, create_app, database_url, db, engine_profile, filter_todos,
+                 identity_cache, item_validators, logger, option_model, probe_statement, role_model, start_db_route,
+                 todo_list_parser, todo_model, todo_page, todo_page_model, todo_page_statement, user_model, warm_up)
+
+# Синхронный драйвер -> асинхронный
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'postgresql+psycopg2': 'postgresql+asyncpg',
+}
+
+
+def wsgi_environ(scope):
+    """WSGI environ для GET-запроса из ASGI scope (тело не читается)"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = 'HTTP_' + key
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def async_database_url(url):
+    """URL базы для асинхронного драйвера: sqlite:///x.db -> sqlite+aiosqlite:///x.db"""
+    url = make_url(url)
+    if url.drivername not in ASYNC_DRIVERS:
+        raise ValueError(f'No async driver for {url.drivername}, set ASYNC_DATABASE_URL')
+    return url.set(drivername=ASYNC_DRIVERS[url.drivername])
+
+
+def async_engine_options(config, profile):
+    """Параметры профиля движка (app.ENGINE_PROFILES) для асинхронного драйвера"""
+    # poolclass профиля синхронный; асинхронному движку нужен свой AsyncAdaptedQueuePool
+    options = {key: value for key, value in ENGINE_PROFILES[profile](config).items()
+               if key not in ('poolclass', 'connect_args')}
+    options.setdefault('pool_pre_ping', True)
+    if profile == 'postgresql':
+        options['connect_args'] = {'server_settings': {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT'])}}
+    elif profile == 'pgbouncer':
+        # asyncpg кэширует подготовленные выражения на соединении, а PgBouncer в режиме
+        # transaction отдает каждую транзакцию произвольному серверному соединению
+        options['connect_args'] = {'statement_cache_size': 0, 'prepared_statement_cache_size': 0}
+    return options
+
+
+async def list_todos(session):
+    args = todo_list_parser.parse_args()
+    last_modified, count = (await session.execute(
+        probe_statement(Todo, lambda stmt: filter_todos(stmt, args)))).one()
+    etag = collection_etag(last_modified, count)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    rows = (await session.scalars(todo_page_statement(args))).all()
+    headers = {}
+    _set_validators(headers, etag, last_modified)
+    return marshal(todo_page(rows, args['limit']), todo_page_model), 200, headers
+
+
+async def list_options(session):
+    last_modified, count = (await session.execute(probe_statement(Options))).one()
+    etag = collection_etag(last_modified, count)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    options = (await session.scalars(db.select(Options))).all()
+    headers = {}
+    _set_validators(headers, etag, last_modified)
+    return marshal([option.to_dict() for option in options], option_model), 200, headers
+
+
+async def list_users(session):
+    users = (await session.scalars(
+        db.select(User).options(db.joinedload(User.role)))).all()
+    return marshal([user.to_dict() for user in users], user_model)
+
+
+async def list_roles(session):
+    roles = (await session.scalars(db.select(Role))).all()
+    return marshal([role.to_dict() for role in roles], role_model)
+
+
+async def get_item(session, model, api_model, id, conditional=True, options=()):
+    obj = await session.get(model, id, options=list(options))
+    if obj is None:
+        abort(404)
+    data = marshal(obj.to_dict(), api_model)
+    if not conditional:
+        return data
+    etag, last_modified = item_validators(data)
+    not_modified = _not_modified(etag, last_modified)
+    if not_modified is not None:
+        return not_modified
+    headers = {}
+    _set_validators(headers, etag, last_modified)
+    return data, 200, headers
+
+
+async def get_todo(session, id):
+    return await get_item(session, Todo, todo_model, id)
+
+
+async def get_option(session, id):
+    return await get_item(session, Options, option_model, id)
+
+
+async def get_user(session, id):
+    return await get_item(session, User, user_model, id, conditional=False,
+                          options=[db.joinedload(User.role)])
+
+
+async def get_role(session, id):
+    return await get_item(session, Role, role_model, id, conditional=False)
+
+
+# Пути и ответы совпадают с Resource из app.py; всего, что здесь нет, касается Flask-приложение
+ASYNC_ROUTES = Map([
+    Rule('/api/todos/', endpoint=list_todos),
+    Rule('/api/todos/<int:id>', endpoint=get_todo),
+    Rule('/api/options/', endpoint=list_options),
+    Rule('/api/options/<int:id>', endpoint=get_option),
+    Rule('/api/users/', endpoint=list_users),
+    Rule('/api/users/<int:id>', endpoint=get_user),
+    Rule('/api/roles/', endpoint=list_roles),
+    Rule('/api/roles/<int:id>', endpoint=get_role),
+], strict_slashes=False)
+
+
+class AsyncAPI:
+    """ASGI-приложение: асинхронные GET для API, остальное — Flask через WsgiToAsgi"""
+
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+        config = flask_app.config
+        self.engines = {'primary': self.create_engine(
+            config['ASYNC_DATABASE_URL'] or async_database_url(config['SQLALCHEMY_DATABASE_URI']), config)}
+        if config['DATABASE_REPLICA_URL']:
+            self.engines['replica'] = self.create_engine(
+                config['ASYNC_REPLICA_DATABASE_URL'] or async_database_url(database_url(config['DATABASE_REPLICA_URL'])),
+                config)
+        self.engine = self.engines['primary']
+        self.sessionmakers = {route: async_sessionmaker(engine, expire_on_commit=False)
+                              for route, engine in self.engines.items()}
+        self.urls = ASYNC_ROUTES.bind('localhost')
+
+    @staticmethod
+    def create_engine(url, config):
+        profile = engine_profile(config)
+        engine = create_async_engine(url, **async_engine_options(config, profile))
+        if profile == 'sqlite' and engine.dialect.name == 'sqlite':
+            event.listen(engine.sync_engine, 'connect', _apply_sqlite_pragmas(config))
+        return engine
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http' or scope['method'] not in ('GET', 'HEAD'):
+            return await self.wsgi(scope, receive, send)
+        try:
+            handler, kwargs = self.urls.match(scope['path'], method='GET')
+        except HTTPException:
+            return await self.wsgi(scope, receive, send)
+        response = await self.dispatch(scope, handler, kwargs)
+        if response is None:
+            return await self.wsgi(scope, receive, send)
+        await self.send_response(response, scope, send)
+
+    async def dispatch(self, scope, handler, kwargs):
+        """Выполняет обработчик в контексте запроса Flask; None — передать запрос Flask-приложению"""
+        with self.app.request_context(wsgi_environ(scope)):
+            # Те же правила, что и в Flask-приложении: реплика, если нет недавней записи пользователя
+            start_db_route()
+            async with self.sessionmakers[g.db_route]() as session:
+                if not await self.authenticated(session):
+                    # Анонимные запросы и remember-cookie обрабатывает Flask-Login как обычно
+                    return None
+                response = self.app.preprocess_request()
+                if response is None:
+                    try:
+                        rv = await handler(session, **kwargs)
+                        response = rv if isinstance(rv, Response) else api.make_response(*unpack(rv))
+                    except HTTPException as e:
+                        response = api.handle_error(e)
+            return self.app.process_response(response)
+
+    async def authenticated(self, session):
+        """То же, что current_user.is_authenticated, но без синхронного user_loader"""
+        user_id = flask_session.get('_user_id')
+        if user_id is None:
+            return False
+        generation = identity_cache.generation()
+        if identity_cache.get(int(user_id), generation) is not None:
+            return True
+        user = await session.get(User, int(user_id), options=[db.joinedload(User.role)])
+        if user is None:
+            return False
+        identity_cache.put(user, generation)
+        return True
+
+    @staticmethod
+    async def send_response(response, scope, send):
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await asyncio.to_thread(warm_up, self.app)
+                for engine in self.engines.values():
+                    async with engine.connect() as connection:
+                        await connection.execute(db.text('SELECT 1'))
+                    logger.info('Async API ready: %s', engine.url.render_as_string(hide_password=True))
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for engine in self.engines.values():
+                    await engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncAPI(create_app())
@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+"""
+Нагрузочный бенчмарк основных маршрутов приложения.
+
+Скрипт наполняет локальную базу до заданного размера и прогоняет маршруты
+/dashboard, /api/todos/, /api/users/, /geoguessr/leaderboard и /geoguessr/save_score
+через тестовый клиент Flask и/или через локальный сервер с несколькими процессами.
+Для каждого маршрута считаются p50/p99 задержки, пропускная способность и среднее
+число SQL-запросов (по заголовку X-DB-Query-Count). Результат сохраняется в JSON,
+чтобы сравнивать его между коммитами:
+
+    python benchmark.py --rows 10000 --output bench-10k.json
+    python benchmark.py --rows 1000000 --database-url sqlite:////tmp/bench-1m.db --mode server
+    python benchmark.py --rows 10000 --compare bench-10k.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.cookiejar import CookieJar
+
+BENCH_USERNAME = 'bench_admin'
+BENCH_PASSWORD = 'bench-password'
+SEED_CHUNK_SIZE = 10000
+
+# Вместо JSON-тела: на каждый запрос — новый набор раундов от сервера
+ROUND_SET = 'round_set'
+
+# (название, метод, путь, JSON-тело)
+ENDPOINTS = [
+    ('dashboard', 'GET', '/dashboard', None),
+    ('api_todos', 'GET', '/api/todos/?limit=50', None),
+    ('api_users', 'GET', '/api/users/', None),
+    ('leaderboard', 'GET', '/geoguessr/leaderboard', None),
+    ('save_score', 'POST', '/geoguessr/save_score', ROUND_SET),
+]
+
+
+def request_bodies(app_module, flask_app, body, count):
+    """Итератор тел запросов; набор раундов засчитывается один раз, поэтому они готовятся заранее"""
+    if body != ROUND_SET:
+        return iter([body] * count)
+    with flask_app.test_request_context():
+        # Токен засчитывается только пользователю, которому выдан: бенчмарк играет за BENCH_USERNAME
+        user_id = app_module.db.session.scalar(
+            app_module.db.select(app_module.User.id).filter_by(username=BENCH_USERNAME))
+        round_sets = [app_module.issue_round_set(user_id) for _ in range(count)]
+    # Координаты ответов клиенту не выдаются: догадки случайные, как у игрока, который не угадал
+    return iter([{'token': round_set['token'],
+                  'guesses': [{'lat': random.uniform(-60, 60), 'lng': random.uniform(-180, 180)}
+                              for _ in range(round_set['rounds'])]}
+                 for round_set in round_sets])
+
+
+def percentile(values, pct):
+    """Процентиль методом ближайшего ранга"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def seed(app_module, rows, users, scores):
+    """Наполняет базу до нужного числа строк через bulk_load (как flask bulk-load --generate)"""
+    db = app_module.db
+    Todo, User, Role = app_module.Todo, app_module.User, app_module.Role
+    GeoGuessrScore = app_module.GeoGuessrScore
+
+    role = Role.query.filter_by(name='admin').first()
+    if role is None:
+        role = Role(name='admin', description='Administrator')
+        db.session.add(role)
+        db.session.commit()
+    if User.query.filter_by(username=BENCH_USERNAME).first() is None:
+        admin = User(username=BENCH_USERNAME, email='bench_admin@example.com', role=role)
+        admin.set_password(BENCH_PASSWORD)
+        db.session.add(admin)
+        db.session.commit()
+    if Role.query.filter_by(name='user').first() is None:
+        db.session.add(Role(name='user', description='User'))
+        db.session.commit()
+
+    for kind, model, target in (('users', User, users), ('todos', Todo, rows), ('scores', GeoGuessrScore, scores)):
+        existing = db.session.scalar(db.select(db.func.count()).select_from(model))
+        if target <= existing:
+            continue
+        started = time.perf_counter()
+        # Дешевый хеш для синтетических пользователей — хеширование здесь не измеряется
+        app_module.bulk_load(kind, app_module.synthetic_rows(kind, existing, target - existing),
+                             SEED_CHUNK_SIZE, {'password_method': 'pbkdf2:sha256:1000'})
+        print(f"  {kind}: +{target - existing} строк за {time.perf_counter() - started:.1f} c")
+
+
+def drive(send, requests, concurrency):
+    """Запускает requests запросов в concurrency потоках; send(slot) -> (status, query_count)"""
+    latencies, query_counts, errors = [], [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(slot):
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            started = time.perf_counter()
+            try:
+                status, queries = send(slot)
+            except Exception as e:  # noqa: BLE001 — ошибка учитывается в отчете
+                status, queries = repr(e), None
+            elapsed = time.perf_counter() - started
+            with lock:
+                if isinstance(status, int) and status < 400:
+                    latencies.append(elapsed)
+                    if queries is not None:
+                        query_counts.append(queries)
+                else:
+                    errors.append(status)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+
+    return {
+        'requests': requests,
+        'errors': len(errors),
+        'error_samples': [str(error) for error in errors[:3]],
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'queries_avg': round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+    }
+
+
+def run_test_client(app_module, flask_app, requests, concurrency):
+    results = {}
+    # Отдельный клиент со своей сессией на каждый поток; вход выполняется до замеров
+    clients = []
+    for _ in range(concurrency):
+        client = flask_app.test_client()
+        client.post('/login', data={'username': BENCH_USERNAME, 'password': BENCH_PASSWORD})
+        clients.append(client)
+
+    for name, method, path, body in ENDPOINTS:
+        bodies = request_bodies(app_module, flask_app, body, requests)
+
+        def send(slot, method=method, path=path, bodies=bodies):
+            response = clients[slot].open(path, method=method, json=next(bodies))
+            queries = response.headers.get('X-DB-Query-Count')
+            return response.status_code, int(queries) if queries else None
+        print(f"  test client: {name}")
+        results[name] = drive(send, requests, concurrency)
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _wait_for(url, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            urllib.request.urlopen(url, timeout=1).close()
+            return
+        except (urllib.error.URLError, ConnectionError):
+            if time.monotonic() > deadline or process.poll() is not None:
+                raise RuntimeError('Сервер не запустился')
+            time.sleep(0.2)
+
+
+def run_server(app_module, flask_app, requests, concurrency, workers):
+    """Запускает workers процессов с многопоточным сервером; клиенты распределяются по ним"""
+    code = (
+        "import sys; from werkzeug.serving import run_simple; from wsgi import app; "
+        "run_simple('127.0.0.1', int(sys.argv[1]), app, threaded=True)"
+    )
+    ports = [_free_port() for _ in range(workers)]
+    servers = [
+        subprocess.Popen([sys.executable, '-c', code, str(port)],
+                         cwd=os.path.dirname(os.path.abspath(__file__)),
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        for port in ports
+    ]
+    bases = [f'http://127.0.0.1:{port}' for port in ports]
+    try:
+        for base, server in zip(bases, servers):
+            _wait_for(base + '/login', server)
+
+        # Сессионная cookie подписана SECRET_KEY и принимается любым процессом
+        jar = CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        login = urllib.parse.urlencode({'username': BENCH_USERNAME, 'password': BENCH_PASSWORD}).encode()
+        opener.open(bases[0] + '/login', data=login).close()
+        cookie = '; '.join(f'{c.name}={c.value}' for c in jar)
+
+        results = {}
+        for name, method, path, body in ENDPOINTS:
+            bodies = request_bodies(app_module, flask_app, body, requests)
+
+            def send(slot, method=method, path=path, bodies=bodies):
+                body = next(bodies)
+                data = json.dumps(body).encode() if body is not None else None
+                request = urllib.request.Request(bases[slot % workers] + path, data=data, method=method,
+                                                 headers={'Cookie': cookie, 'Content-Type': 'application/json'})
+                try:
+                    with urllib.request.urlopen(request, timeout=60) as response:
+                        response.read()
+                        status, headers = response.status, response.headers
+                except urllib.error.HTTPError as e:
+                    status, headers = e.code, e.headers
+                queries = headers.get('X-DB-Query-Count')
+                return status, int(queries) if queries else None
+            print(f"  server ({workers} процессов): {name}")
+            results[name] = drive(send, requests, concurrency)
+        return results
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait(timeout=10)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(current, previous_path):
+    """Печатает изменение p50/p99/пропускной способности относительно прошлого запуска"""
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nСравнение с {previous_path} (коммит {previous.get('commit')}):")
+    for mode, endpoints in current['results'].items():
+        for name, stats in endpoints.items():
+            old = previous.get('results', {}).get(mode, {}).get(name)
+            if not old:
+                continue
+            parts = []
+            for key in ('p50_ms', 'p99_ms', 'throughput_rps', 'queries_avg'):
+                if stats.get(key) is not None and old.get(key):
+                    parts.append(f"{key} {old[key]} -> {stats[key]} ({(stats[key] / old[key] - 1) * 100:+.1f}%)")
+            print(f"  {mode}/{name}: " + ', '.join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк основных маршрутов')
+    parser.add_argument('--rows', type=int, default=10000, help='Число задач (10000, 1000000, 10000000)')
+    parser.add_argument('--users', type=int, help='Число пользователей (по умолчанию rows / 100, не более 10000)')
+    parser.add_argument('--scores', type=int, help='Число результатов GeoGuessr (по умолчанию rows / 10)')
+    parser.add_argument('--database-url', help='База для бенчмарка (по умолчанию временная SQLite)')
+    parser.add_argument('--mode', choices=('testclient', 'server', 'both'), default='both')
+    parser.add_argument('--requests', type=int, default=200, help='Запросов на маршрут')
+    parser.add_argument('--concurrency', type=int, default=8, help='Параллельных клиентов')
+    parser.add_argument('--workers', type=int, default=4, help='Процессов локального сервера')
+    parser.add_argument('--output', help='Файл для результатов в JSON')
+    parser.add_argument('--compare', help='JSON прошлого запуска для сравнения')
+    args = parser.parse_args()
+
+    users = args.users if args.users is not None else max(10, min(args.rows // 100, 10000))
+    scores = args.scores if args.scores is not None else max(10, args.rows // 10)
+
+    temp_dir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        temp_dir = tempfile.TemporaryDirectory()
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(temp_dir.name, 'bench.db')
+    os.environ.setdefault('SQL_STATS_HEADERS', '1')
+    # Бенчмарк отправляет игру сразу, не открывая раунды: проверка длительности раундов выключена
+    os.environ.setdefault('GEOGUESSR_MIN_ROUND_SECONDS', '0')
+
+    import app as app_module
+
+    flask_app = app_module.create_app()
+    with flask_app.app_context():
+        app_module.db.create_all()
+        app_module.create_todo_search_index()
+        print(f"Наполнение базы: {args.rows} задач, {users} пользователей, {scores} результатов")
+        seed(app_module, args.rows, users, scores)
+        dialect = app_module.db.session.get_bind().dialect.name
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'database': dialect,
+        'rows': {'todos': args.rows, 'users': users, 'scores': scores},
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'results': {},
+    }
+    try:
+        if args.mode in ('testclient', 'both'):
+            report['results']['testclient'] = run_test_client(app_module, flask_app, args.requests, args.concurrency)
+        if args.mode in ('server', 'both'):
+            report['workers'] = args.workers
+            report['results']['server'] = run_server(app_module, flask_app, args.requests, args.concurrency, args.workers)
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+    print(f"\n{'режим/маршрут':<26} {'p50, мс':>9} {'p99, мс':>9} {'зап/с':>9} {'SQL':>6} {'ошибки':>7}")
+    for mode, endpoints in report['results'].items():
+        for name, stats in endpoints.items():
+            print(f"{mode + '/' + name:<26} {stats['p50_ms'] or '-':>9} {stats['p99_ms'] or '-':>9} "
+                  f"{stats['throughput_rps'] or '-':>9} {stats['queries_avg'] or '-':>6} {stats['errors']:>7}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {args.output}")
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
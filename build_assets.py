@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Сборка статических ресурсов.
+
+1. Сторонние библиотеки из assets.json скачиваются с CDN в static/vendor/<пакет>/
+   вместе со шрифтами и картинками, на которые ссылаются их CSS-файлы.
+2. Каждый файл из static/ копируется в static/dist/ с хешем содержимого в имени
+   (css/adminlte.min.css -> dist/css/adminlte.min.3f2a9c1d8e4b.css); ссылки url(...)
+   внутри CSS переписываются на имена с хешем.
+3. Для текстовых файлов рядом пишутся сжатые варианты .gz и .br (если установлен brotli).
+4. Соответствие исходных и новых имен сохраняется в static/dist/manifest.json —
+   по нему приложение подставляет имена с хешем в url_for('static', ...).
+
+    python build_assets.py
+    python build_assets.py --skip-vendor     # без сети: только хеши и сжатие
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import sys
+import urllib.parse
+import urllib.request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+VENDOR_DIR = 'vendor'
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+# Сжимаем только то, что сжимается; woff2, png и jpg уже сжаты
+COMPRESSIBLE = {'.css', '.js', '.map', '.json', '.svg', '.txt', '.html', '.ttf', '.otf', '.eot', '.ico'}
+MIN_COMPRESS_SIZE = 512
+
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def load_vendor_config():
+    """Список сторонних пакетов из assets.json"""
+    with open(os.path.join(BASE_DIR, 'assets.json'), encoding='utf-8') as f:
+        return json.load(f)['vendor']
+
+
+def local_reference(ref):
+    """Делит ссылку из CSS на путь и хвост (?query/#fragment); None для внешних ссылок"""
+    if ref.startswith(('data:', '#', '/')) or urllib.parse.urlsplit(ref).scheme:
+        return None
+    match = re.match(r'([^?#]*)(.*)', ref)
+    return match.group(1), match.group(2)
+
+
+def download(url, path):
+    """Скачивает url в path"""
+    request = urllib.request.Request(url, headers={'User-Agent': 'build_assets'})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        data = response.read()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+    return data
+
+
+def vendor_package(name, package):
+    """Скачивает файлы пакета и все ресурсы, на которые ссылаются его CSS"""
+    base = package['base']
+    target = os.path.join(STATIC_DIR, VENDOR_DIR, name)
+    pending = list(package['files'])
+    seen = set()
+    while pending:
+        relative = pending.pop()
+        if relative in seen:
+            continue
+        seen.add(relative)
+        data = download(base + relative, os.path.join(target, *relative.split('/')))
+        print(f"  {name}/{relative} ({len(data)} байт)")
+        if not relative.endswith('.css'):
+            continue
+        for _, ref in CSS_URL.findall(data.decode('utf-8')):
+            parts = local_reference(ref)
+            if parts is None or not parts[0]:
+                continue
+            resolved = posixpath.normpath(posixpath.join(posixpath.dirname(relative), parts[0]))
+            if resolved.startswith('..'):
+                print(f"  пропущено {ref}: ссылка за пределы пакета")
+                continue
+            pending.append(resolved)
+    return len(seen)
+
+
+def collect_sources():
+    """Логические пути (относительно static/) всех исходных файлов, кроме dist/"""
+    sources = []
+    for root, dirs, files in os.walk(STATIC_DIR):
+        relative_root = os.path.relpath(root, STATIC_DIR).replace(os.sep, '/')
+        if relative_root == DIST_DIR:
+            dirs[:] = []
+            continue
+        dirs.sort()
+        for file in sorted(files):
+            path = file if relative_root == '.' else f'{relative_root}/{file}'
+            if not path.endswith(('.gz', '.br')):
+                sources.append(path)
+    return sources
+
+
+def hashed_name(path, data):
+    """css/app.css -> dist/css/app.<sha256>.css"""
+    digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+    stem, ext = posixpath.splitext(path)
+    return f'{DIST_DIR}/{stem}.{digest}{ext}'
+
+
+def rewrite_css(path, text, manifest):
+    """Переписывает url(...) в CSS на имена с хешем (относительно нового места файла)"""
+    def replace(match):
+        quote, ref = match.groups()
+        parts = local_reference(ref)
+        if parts is None or not parts[0]:
+            return match.group(0)
+        target = posixpath.normpath(posixpath.join(posixpath.dirname(path), parts[0]))
+        if target not in manifest:
+            return match.group(0)
+        # В dist сохраняется структура каталогов, поэтому путь считается от dist/<каталог CSS>
+        relative = posixpath.relpath(manifest[target], posixpath.dirname(f'{DIST_DIR}/{path}'))
+        return f'url({quote}{relative}{parts[1]}{quote})'
+    return CSS_URL.sub(replace, text)
+
+
+def write_compressed(path, data):
+    """Пишет .gz и .br рядом с файлом, если это дает выигрыш"""
+    variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(data, quality=11)))
+    written = 0
+    for suffix, compressed in variants:
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written += 1
+    return written
+
+
+def build(compress=True):
+    """Собирает static/dist и манифест; возвращает манифест"""
+    dist = os.path.join(STATIC_DIR, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+    sources = collect_sources()
+    manifest = {}
+    compressed = 0
+    # CSS обрабатываются последними: к этому моменту известны хеши шрифтов и картинок
+    for path in sorted(sources, key=lambda p: p.endswith('.css')):
+        with open(os.path.join(STATIC_DIR, *path.split('/')), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = rewrite_css(path, data.decode('utf-8'), manifest).encode('utf-8')
+        manifest[path] = hashed_name(path, data)
+        target = os.path.join(STATIC_DIR, *manifest[path].split('/'))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, 'wb') as f:
+            f.write(data)
+        if compress and posixpath.splitext(path)[1].lower() in COMPRESSIBLE and len(data) >= MIN_COMPRESS_SIZE:
+            compressed += write_compressed(target, data)
+    with open(os.path.join(dist, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"Файлов с хешем: {len(manifest)}, сжатых вариантов: {compressed}")
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сборка статических ресурсов')
+    parser.add_argument('--skip-vendor', action='store_true',
+                        help='Не скачивать сторонние библиотеки (использовать уже скачанные)')
+    parser.add_argument('--no-compress', action='store_true', help='Не создавать .gz/.br варианты')
+    args = parser.parse_args()
+
+    if not args.skip_vendor:
+        print("Загрузка сторонних библиотек...")
+        try:
+            for name, package in load_vendor_config().items():
+                vendor_package(name, package)
+        except OSError as e:
+            print(f"Ошибка загрузки: {e}")
+            print("Запустите с --skip-vendor, чтобы собрать без сторонних библиотек")
+            return 1
+    if brotli is None and not args.no_compress:
+        print("Модуль brotli не установлен: будут созданы только .gz варианты")
+    build(compress=not args.no_compress)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,40 +1,48 @@
 #!/usr/bin/env python
 """
 Скрипт для компиляции файлов перевода Flask-Babel
+
+Та же функция compile_catalogs используется командой flask precompile-templates.
 """
 
 import os
-from babel.messages.frontend import compile_catalog
+
+from babel.messages.mofile import write_mo
+from babel.messages.pofile import read_po
+
+
+def compile_catalogs(translations_dir):
+    """Компилирует <translations_dir>/*/LC_MESSAGES/*.po в .mo; возвращает список локалей"""
+    locales = []
+    for locale in sorted(os.listdir(translations_dir)):
+        messages_dir = os.path.join(translations_dir, locale, 'LC_MESSAGES')
+        if not os.path.isdir(messages_dir):
+            continue
+        for file in os.listdir(messages_dir):
+            if not file.endswith('.po'):
+                continue
+            po_path = os.path.join(messages_dir, file)
+            with open(po_path, 'rb') as f:
+                catalog = read_po(f, locale=locale)
+            with open(po_path[:-3] + '.mo', 'wb') as f:
+                write_mo(f, catalog, use_fuzzy=True)
+        locales.append(locale)
+    return locales
+
 
 def compile_translations():
     """Компиляция файлов перевода"""
     print("Компиляция файлов перевода...")
-    
+
     # Путь к каталогу с переводами
     translations_dir = os.path.join(os.getcwd(), 'translations')
-    
+
     if not os.path.exists(translations_dir):
         print(f"Каталог {translations_dir} не найден!")
         return
-    
-    # Проходим по всем подкаталогам в поисках .po файлов
-    for root, dirs, files in os.walk(translations_dir):
-        for file in files:
-            if file.endswith('.po'):
-                po_file = os.path.join(root, file)
-                mo_file = os.path.join(root, file.replace('.po', '.mo'))
-                
-                print(f"Компиляция {po_file} -> {mo_file}")
-                
-                # Используем babel для компиляции
-                compiler = compile_catalog()
-                compiler.directory = root
-                compiler.domain = 'messages'
-                compiler.use_fuzzy = True
-                compiler.finalize_options()
-                compiler.run()
-                
-    print("Компиляция завершена!")
+
+    locales = compile_catalogs(translations_dir)
+    print(f"Компиляция завершена! Локали: {', '.join(locales)}")
 
 if __name__ == "__main__":
-    compile_translations()
\ No newline at end of file
+    compile_translations()
@@ -0,0 +1,47 @@
+"""
+Настройки gunicorn для production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Приложение загружается один раз в мастер-процессе (preload_app) и наследуется рабочими
+процессами через fork; пул соединений и поток журнала пересоздаются в каждом процессе
+(модуль app регистрирует обработчик os.register_at_fork). Перед приемом запросов
+каждый процесс прогревается: мапперы ORM, шаблоны, переводы и соединения с БД.
+"""
+
+import multiprocessing
+import os
+
+# Несколько процессов: кэш ответов должен быть общим, иначе коммит в одном процессе
+# не сбросит записи в остальных (app.RESPONSE_CACHE_BACKENDS)
+os.environ.setdefault('RESPONSE_CACHE_BACKEND', 'sqlite')
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+# Кэш пользователя и роли узнает о коммитах других процессов по поколениям общего кэша ответов;
+# без него (lru/none) несколько процессов держали бы удаленного пользователя или старую роль до TTL
+if workers > 1 and os.environ['RESPONSE_CACHE_BACKEND'] != 'sqlite':
+    os.environ.setdefault('IDENTITY_CACHE_TTL', '0')
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+# Перезапуск процесса после N запросов ограничивает рост памяти
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '5000'))
+max_requests_jitter = max_requests // 10
+preload_app = True
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    """Один раз в мастер-процессе: недостающие таблицы и полнотекстовый индекс"""
+    from app import init_database
+    init_database(server.app.wsgi())
+
+
+def post_worker_init(worker):
+    """В рабочем процессе до приема запросов"""
+    from app import warm_up
+    warm_up(worker.wsgi)
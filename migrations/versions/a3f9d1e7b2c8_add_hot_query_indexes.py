@@ -0,0 +1,48 @@
+"""Add secondary indexes for hot queries
+
+Revision ID: a3f9d1e7b2c8
+Revises: f1c6b8a2d5e4
+Create Date: 2026-10-16 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f9d1e7b2c8'
+down_revision = 'f1c6b8a2d5e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.create_index('ix_todo_completed_due_date', ['completed', 'due_date'], unique=False)
+        batch_op.create_index('ix_todo_due_date', ['due_date'], unique=False)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index('ix_user_role_id', ['role_id'], unique=False)
+
+    with op.batch_alter_table('options', schema=None) as batch_op:
+        batch_op.create_index('ix_options_user_id_category', ['user_id', 'category'], unique=False)
+
+    with op.batch_alter_table('geo_guessr_score', schema=None) as batch_op:
+        batch_op.create_index('ix_geo_guessr_score_total_score', ['total_score'], unique=False)
+        batch_op.create_index('ix_geo_guessr_score_user_id_total_score', ['user_id', 'total_score'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('geo_guessr_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_geo_guessr_score_user_id_total_score')
+        batch_op.drop_index('ix_geo_guessr_score_total_score')
+
+    with op.batch_alter_table('options', schema=None) as batch_op:
+        batch_op.drop_index('ix_options_user_id_category')
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index('ix_user_role_id')
+
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.drop_index('ix_todo_due_date')
+        batch_op.drop_index('ix_todo_completed_due_date')
@@ -0,0 +1,28 @@
+"""Add round_id to GeoGuessr scores for server-issued round sets
+
+Revision ID: b5e2d8f4a7c1
+Revises: a3f9d1e7b2c8
+Create Date: 2026-10-16 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5e2d8f4a7c1'
+down_revision = 'a3f9d1e7b2c8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('geo_guessr_score', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('round_id', sa.String(length=32), nullable=True))
+        batch_op.create_index('ix_geo_guessr_score_round_id', ['round_id'], unique=True)
+
+
+def downgrade():
+    with op.batch_alter_table('geo_guessr_score', schema=None) as batch_op:
+        batch_op.drop_index('ix_geo_guessr_score_round_id')
+        batch_op.drop_column('round_id')
@@ -0,0 +1,26 @@
+"""Add (created_at, id) index on todo for keyset pagination
+
+Revision ID: b7e1c9d2a4f3
+Revises: 39aa02879f86, geoguessr_001
+Create Date: 2026-10-16 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e1c9d2a4f3'
+down_revision = ('39aa02879f86', 'geoguessr_001')
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.create_index('ix_todo_created_at_id', ['created_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('todo', schema=None) as batch_op:
+        batch_op.drop_index('ix_todo_created_at_id')
@@ -0,0 +1,44 @@
+"""Add per-user GeoGuessr summary table
+
+Revision ID: c4d8e2f1a9b6
+Revises: b7e1c9d2a4f3
+Create Date: 2026-10-16 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4d8e2f1a9b6'
+down_revision = 'b7e1c9d2a4f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('geo_guessr_user_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('games_played', sa.Integer(), nullable=False),
+    sa.Column('total_score', sa.BigInteger(), nullable=False),
+    sa.Column('best_score', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+    with op.batch_alter_table('geo_guessr_user_stats', schema=None) as batch_op:
+        batch_op.create_index('ix_geo_guessr_user_stats_best_score', ['best_score'], unique=False)
+
+    # Заполняем сводку по уже сохраненным играм
+    op.execute(
+        "INSERT INTO geo_guessr_user_stats (user_id, games_played, total_score, best_score, updated_at) "
+        "SELECT user_id, COALESCE(SUM(games_played), 0), SUM(total_score), MAX(total_score), MAX(created_at) "
+        "FROM geo_guessr_score GROUP BY user_id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('geo_guessr_user_stats', schema=None) as batch_op:
+        batch_op.drop_index('ix_geo_guessr_user_stats_best_score')
+
+    op.drop_table('geo_guessr_user_stats')
@@ -0,0 +1,28 @@
+"""Add updated_at to options for HTTP validators
+
+Revision ID: e9b3a6d4c1f7
+Revises: d2a7f5c3e8b1
+Create Date: 2026-10-16 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9b3a6d4c1f7'
+down_revision = 'd2a7f5c3e8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('options', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE options SET updated_at = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    with op.batch_alter_table('options', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,63 @@
+"""Add full-text search index over todo title and description
+
+SQLite: external-content FTS5 table todo_fts kept in sync by triggers.
+PostgreSQL: generated tsvector column with a GIN index.
+
+Revision ID: f1c6b8a2d5e4
+Revises: e9b3a6d4c1f7
+Create Date: 2026-10-16 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c6b8a2d5e4'
+down_revision = 'e9b3a6d4c1f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE todo_fts USING fts5("
+            "title, description, content='todo', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        )
+        op.execute(
+            "CREATE TRIGGER todo_fts_ai AFTER INSERT ON todo BEGIN "
+            "INSERT INTO todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER todo_fts_ad AFTER DELETE ON todo BEGIN "
+            "INSERT INTO todo_fts(todo_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER todo_fts_au AFTER UPDATE OF title, description ON todo BEGIN "
+            "INSERT INTO todo_fts(todo_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            "INSERT INTO todo_fts(rowid, title, description) VALUES (new.id, new.title, new.description); END"
+        )
+        op.execute("INSERT INTO todo_fts(todo_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE todo ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+            "setweight(to_tsvector('simple', coalesce(description, '')), 'B')) STORED"
+        )
+        op.execute("CREATE INDEX ix_todo_search_vector ON todo USING GIN (search_vector)")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS todo_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS todo_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS todo_fts_ai")
+        op.execute("DROP TABLE IF EXISTS todo_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_todo_search_vector")
+        op.execute("ALTER TABLE todo DROP COLUMN IF EXISTS search_vector")
@@ -0,0 +1,20 @@
+"""
+Точка входа: приложение по умолчанию для gunicorn, flask CLI и разработки.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+    flask --app wsgi run
+    python wsgi.py
+
+Модуль app только объявляет фабрику create_app: его импорт не подключается к БД и не настраивает журнал.
+"""
+
+import os
+
+from app import create_app, init_database
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    init_database(app)
+    app.run(host='0.0.0.0', port=5000, debug=os.getenv('FLASK_ENV') == 'development')